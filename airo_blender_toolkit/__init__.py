@@ -4,18 +4,49 @@ from airo_blender_toolkit.assets import Asset, World, assets, filtered_assets
 from airo_blender_toolkit.camera import Camera
 from airo_blender_toolkit.cleanup import clear_scene
 from airo_blender_toolkit.clothes import PolygonalPants, PolygonalShirt, Towel
+from airo_blender_toolkit.coco_loader import CocoKeypointsArrays, load_coco_keypoints
+from airo_blender_toolkit.coco_writer import CocoShardWriter, merge_coco_shards
 from airo_blender_toolkit.colors import random_hsv
 from airo_blender_toolkit.datastructures import InterpolatingDict
 from airo_blender_toolkit.gripper import BlockGripper, Gripper
-from airo_blender_toolkit.keyframe import is_keyframed, keyframe_trajectory, keyframe_visibility
-from airo_blender_toolkit.keypointed_object import KeypointedObject
+from airo_blender_toolkit.keyframe import is_keyframed, keyframe_trajectory, keyframe_visibility, next_keyframe
+from airo_blender_toolkit.keypointed_object import KeypointedObject, KeypointSnapshot
+from airo_blender_toolkit.mesh_annotation import (
+    mask_bbox,
+    mask_to_rle,
+    mesh_annotation,
+    rasterize_depth,
+    rasterize_triangles,
+    rle_to_mask,
+)
 from airo_blender_toolkit.object import _blender_object_from_mesh
-from airo_blender_toolkit.path import CartesianPath, LinearPath, TiltedEllipticalArcPath
+from airo_blender_toolkit.path import (
+    BezierPath,
+    BSplinePath,
+    CartesianPath,
+    CompositePath,
+    LinearPath,
+    TiltedEllipticalArcPath,
+)
 from airo_blender_toolkit.primitives import BlenderObject, Cube, Cylinder, IcoSphere, Plane, Sphere
+from airo_blender_toolkit.projection import (
+    image_resolution,
+    in_image_mask,
+    intrinsics_matrix,
+    project_points,
+    view_projection_matrix,
+)
+from airo_blender_toolkit.sample_store import (
+    SampleStore,
+    SampleStoreWriter,
+    sample_store_from_coco,
+    sample_store_to_coco,
+)
 from airo_blender_toolkit.sampling import point_on_sphere, sample_point
 from airo_blender_toolkit.trajectory import Trajectory
 from airo_blender_toolkit.transform import (
     Frame,
+    FrameArray,
     project_point_on_line,
     rotate_point_2D,
     rotate_point_3D,
@@ -26,25 +57,52 @@ from airo_blender_toolkit.transform import (
 )
 from airo_blender_toolkit.triangulate import triangulate
 from airo_blender_toolkit.view_3d import show_wireframes
-from airo_blender_toolkit.visible_vertices import is_visible, visible_vertices
+from airo_blender_toolkit.visible_vertices import (
+    DepthMap,
+    VisibilityContext,
+    are_visible,
+    are_visible_from_cameras,
+    is_visible,
+    project_to_cameras,
+    render_depth_map,
+    visible_vertices,
+    visible_vertices_mask,
+    visible_vertices_masks,
+)
 
 # Prevents F401 unused imports
 __all__ = (
     "camera",
     "colors",
     "Frame",
+    "FrameArray",
     "project_point_on_line",
     "_blender_object_from_mesh",
     "select_only",
     "is_visible",
+    "are_visible",
     "visible_vertices",
+    "visible_vertices_mask",
+    "visible_vertices_masks",
+    "are_visible_from_cameras",
+    "project_to_cameras",
+    "project_points",
+    "view_projection_matrix",
+    "intrinsics_matrix",
+    "image_resolution",
+    "in_image_mask",
+    "VisibilityContext",
+    "DepthMap",
+    "render_depth_map",
     "KeypointedObject",
+    "KeypointSnapshot",
     "visualize_transform",
     "visualize_path",
     "Trajectory",
     "keyframe_trajectory",
     "keyframe_visibility",
     "is_keyframed",
+    "next_keyframe",
     "CartesianPath",
     "TiltedEllipticalArcPath",
     "InterpolatingDict",
@@ -72,7 +130,24 @@ __all__ = (
     "filtered_assets",
     "Asset",
     "LinearPath",
+    "BezierPath",
+    "BSplinePath",
+    "CompositePath",
     "Cylinder",
     "Cube",
     "visualize_line_segment",
+    "CocoShardWriter",
+    "merge_coco_shards",
+    "CocoKeypointsArrays",
+    "load_coco_keypoints",
+    "mesh_annotation",
+    "rasterize_triangles",
+    "rasterize_depth",
+    "mask_to_rle",
+    "rle_to_mask",
+    "mask_bbox",
+    "SampleStore",
+    "SampleStoreWriter",
+    "sample_store_from_coco",
+    "sample_store_to_coco",
 )
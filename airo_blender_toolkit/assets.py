@@ -1,16 +1,19 @@
 """ Module that provides an API for the Blender Asset Browser.
 It works by first building a cache of all available assets.
 This is slow (e.g. 15s for the Poly Haven Assets) because it requires opening all Blend files with assets.
-However this only happens when the names of the Blend files present in the Asset Libraries change.
-To force the cache to update, delete the ~/.cache/airo-blender-toolkit folder.
+However the cache is kept per Blend file, keyed by its path, modification time and size, so only Blend files that
+are added or changed in the Asset Libraries are opened again.
+To force the cache to rebuild completely, call rebuild_asset_cache() or delete the ~/.cache/airo-blender-toolkit
+folder.
 
 After the cache if built, it can be used to filter assets by type and tags.
 The chosen assets can then easily be loaded with asset.load()
 """
 
+import os
 import time
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 import bpy
 import numpy as np
@@ -141,47 +144,81 @@ def list_blend_files(asset_library: str) -> List[str]:
     return blend_files
 
 
-def rebuild_asset_cache():
-    """Replace the old asset cache with the new one. The asset cache contains a list this the info of all found assets
-    and also a list with the blend file in which these assets where found.
+def blend_file_signature(blend_file: str) -> Tuple[int, int]:
+    """The modification time in nanoseconds and the size in bytes of a blend file, which change when it is saved."""
+    stat = os.stat(blend_file)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _library_blend_files() -> Dict[str, Tuple[str, Tuple[int, int]]]:
+    """The library name and signature of every blend file in the Asset Libraries, by path."""
+    library_blend_files = {}
+    # adapted from: https://blender.stackexchange.com/questions/244971
+    asset_libraries = bpy.context.preferences.filepaths.asset_libraries
+    for asset_library in asset_libraries:
+        for blend_file in list_blend_files(asset_library):
+            library_blend_files[blend_file] = (asset_library.name, blend_file_signature(blend_file))
+    return library_blend_files
+
+
+def update_asset_cache(force: bool = False) -> int:
+    """Bring the asset cache up to date with the Asset Libraries. The cache keeps the assets per blend file, together
+    with the library name and signature of the file. Only blend files that are new or whose signature changed are
+    opened, and the assets of removed blend files are dropped.
+
+    Args:
+        force (bool, optional): open all blend files again. Defaults to False.
+
+    Returns:
+        int: the amount of blend files that were opened.
     """
     with Cache(cache_directory()) as cache:
-        assets = []
-        processed_blend_files = set()
-
-        # adapted from: https://blender.stackexchange.com/questions/244971
-        asset_libraries = bpy.context.preferences.filepaths.asset_libraries
-        for asset_library in asset_libraries:
-            blend_files = list_blend_files(asset_library)
-            processed_blend_files.update(blend_files)
-            for blend_file in blend_files:
+        cached_blend_files = {} if force else cache.get("blend_files", {})
+        blend_files = {}
+        amount_scanned = 0
+
+        for blend_file, (library_name, signature) in _library_blend_files().items():
+            entry = cached_blend_files.get(blend_file)
+            if entry is None or entry["signature"] != signature or entry["library_name"] != library_name:
                 assets_to_be_processed = load_blend_file_assets(blend_file)
-                processed_assets = process_assets(assets_to_be_processed, asset_library.name, blend_file)
-                assets.extend(processed_assets)
+                processed_assets = process_assets(assets_to_be_processed, library_name, blend_file)
+                entry = {"library_name": library_name, "signature": signature, "assets": processed_assets}
+                amount_scanned += 1
+            blend_files[blend_file] = entry
 
-        cache["processed_blend_files"] = processed_blend_files
+        assets = [asset for entry in blend_files.values() for asset in entry["assets"]]
+        cache["blend_files"] = blend_files
         cache["assets"] = assets
-        print(f"Cached the info of {len(assets)} assets.")
+        cache.pop("processed_blend_files", None)  # the cache format before it was kept per blend file
+        print(f"Cached the info of {len(assets)} assets, {amount_scanned} blend files were opened.")
+        return amount_scanned
+
+
+def rebuild_asset_cache():
+    """Replace the old asset cache with a new one, for which all blend files in the Asset Libraries are opened."""
+    update_asset_cache(force=True)
 
 
 def asset_cache_outdated():
-    """Checks whether the cached blend files match with the blend files found in the Asset Libraries.
+    """Checks whether the blend files in the Asset Libraries were added, removed or changed since the cache was built.
 
     Returns:
         bool: whether the cache is outdated.
     """
     with Cache(cache_directory()) as cache:
-        if "processed_blend_files" not in cache:
+        if "blend_files" not in cache:
             return True
-        processed_blend_files = cache["processed_blend_files"]  # list of paths
+        cached_blend_files = cache["blend_files"]
 
-    asset_blend_files = set()
-    asset_libraries = bpy.context.preferences.filepaths.asset_libraries
-    for asset_library in asset_libraries:
-        blend_files = list_blend_files(asset_library)
-        asset_blend_files.update(blend_files)
+    library_blend_files = _library_blend_files()
+    if set(library_blend_files) != set(cached_blend_files):
+        return True
 
-    return not (processed_blend_files == asset_blend_files)
+    for blend_file, (library_name, signature) in library_blend_files.items():
+        entry = cached_blend_files[blend_file]
+        if entry["signature"] != signature or entry["library_name"] != library_name:
+            return True
+    return False
 
 
 def assets() -> List[Asset]:
@@ -192,9 +229,9 @@ def assets() -> List[Asset]:
     """
     if asset_cache_outdated():
         start = time.time()
-        print("airo-blender-toolkit: Rebuilding asset cache, this can take a while.")
-        rebuild_asset_cache()
-        print(f"airo-blender-toolkit: Asset cache has been rebuilt in {time.time() - start:.2f} seconds.")
+        print("airo-blender-toolkit: Updating asset cache, this can take a while.")
+        update_asset_cache()
+        print(f"airo-blender-toolkit: Asset cache has been updated in {time.time() - start:.2f} seconds.")
 
     with Cache(cache_directory()) as cache:
         return cache["assets"]
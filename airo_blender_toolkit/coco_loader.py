@@ -0,0 +1,184 @@
+"""Loader that parses COCO keypoints JSON into NumPy columns instead of one pydantic object per annotation."""
+import json
+import os
+from typing import List
+
+import numpy as np
+
+from airo_blender_toolkit.coco_parser import CocoImage, CocoKeypointAnnotation, CocoKeypointCategory, CocoKeypoints
+
+
+class CocoKeypointsArrays:
+    """Columnar COCO keypoints dataset, the annotations are the rows of the arrays.
+
+    Attributes:
+        image_ids (np.ndarray): (M,) ids of the images.
+        image_file_names (np.ndarray): (M,) file names of the images.
+        image_sizes (np.ndarray): (M, 2) width and height of the images.
+        annotation_ids (np.ndarray): (N,) ids of the annotations.
+        image_id (np.ndarray): (N,) image id of each annotation.
+        category_id (np.ndarray): (N,) category id of each annotation.
+        keypoints (np.ndarray): (N, K, 3) x, y and visibility flag of the keypoints, with K the largest amount of
+                                keypoints of any annotation. Annotations with fewer keypoints are padded with zeros.
+        bbox (np.ndarray): (N, 4) x, y, width and height of the bounding boxes.
+        area (np.ndarray): (N,) area of the annotations.
+        iscrowd (np.ndarray): (N,) crowd flag of the annotations.
+        categories (List[dict]): the categories of the dataset.
+    """
+
+    _array_names = (
+        "image_ids",
+        "image_file_names",
+        "image_sizes",
+        "annotation_ids",
+        "image_id",
+        "category_id",
+        "keypoints",
+        "bbox",
+        "area",
+        "iscrowd",
+    )
+
+    def __init__(self, categories: List[dict], **arrays):
+        self.categories = categories
+        for name in self._array_names:
+            setattr(self, name, arrays[name])
+        self._indices = {}
+
+    def __len__(self):
+        return len(self.annotation_ids)
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Build the arrays from a COCO keypoints dictionary, as loaded with json.load()."""
+        images = data["images"]
+        annotations = data["annotations"]
+
+        keypoint_lists = [annotation["keypoints"] for annotation in annotations]
+        amount_of_keypoints = max((len(keypoints) // 3 for keypoints in keypoint_lists), default=0)
+        if all(len(keypoints) == 3 * amount_of_keypoints for keypoints in keypoint_lists):
+            keypoints = np.array(keypoint_lists, dtype=np.float32).reshape(len(annotations), amount_of_keypoints, 3)
+        else:
+            keypoints = np.zeros((len(annotations), amount_of_keypoints, 3), dtype=np.float32)
+            for row, annotation_keypoints in zip(keypoints, keypoint_lists):
+                row.ravel()[: len(annotation_keypoints)] = annotation_keypoints
+
+        image_sizes = np.array([(image["width"], image["height"]) for image in images], dtype=np.int64)
+        return cls(
+            data["categories"],
+            image_ids=np.array([image["id"] for image in images], dtype=np.int64),
+            image_file_names=np.array([image["file_name"] for image in images], dtype=str),
+            image_sizes=image_sizes.reshape(-1, 2),
+            annotation_ids=np.array([annotation["id"] for annotation in annotations], dtype=np.int64),
+            image_id=np.array([annotation["image_id"] for annotation in annotations], dtype=np.int64),
+            category_id=np.array([annotation["category_id"] for annotation in annotations], dtype=np.int64),
+            keypoints=keypoints,
+            bbox=np.array([annotation["bbox"] for annotation in annotations], dtype=np.float32).reshape(-1, 4),
+            area=np.array([annotation["area"] for annotation in annotations], dtype=np.float32),
+            iscrowd=np.array([annotation["iscrowd"] for annotation in annotations], dtype=np.uint8),
+        )
+
+    def _index(self, column):
+        """Annotation indices sorted by a column, and the sorted values of that column."""
+        if column not in self._indices:
+            values = getattr(self, column)
+            order = np.argsort(values, kind="stable")
+            self._indices[column] = order, values[order]
+        return self._indices[column]
+
+    def _lookup(self, column, value):
+        order, sorted_values = self._index(column)
+        start = np.searchsorted(sorted_values, value, side="left")
+        end = np.searchsorted(sorted_values, value, side="right")
+        return order[start:end]
+
+    def annotations_of_image(self, image_id: int) -> np.ndarray:
+        """Indices of the annotations of an image, in the order in which they were stored."""
+        return self._lookup("image_id", image_id)
+
+    def annotations_of_category(self, category_id: int) -> np.ndarray:
+        """Indices of the annotations of a category, in the order in which they were stored."""
+        return self._lookup("category_id", category_id)
+
+    def save_npz(self, path: str, source: dict = None):
+        """Save the arrays to an .npz file.
+
+        Args:
+            path (str): the .npz file.
+            source (dict, optional): description of the file the arrays were loaded from, which load_coco_keypoints()
+                                     compares to decide if the .npz file is still up to date.
+        """
+        arrays = {name: getattr(self, name) for name in self._array_names}
+        arrays["source"] = np.array(json.dumps(source))
+        with open(path, "wb") as file:  # np.savez would append .npz to other file names
+            np.savez(file, categories=np.array(json.dumps(self.categories)), **arrays)
+
+    @classmethod
+    def load_npz(cls, path: str):
+        with np.load(path, allow_pickle=False) as npz:
+            arrays = {name: npz[name] for name in cls._array_names}
+            categories = json.loads(str(npz["categories"]))
+        return cls(categories, **arrays)
+
+
+def _validate(data, validate, sample_size):
+    if validate is True:
+        CocoKeypoints(**data)
+    elif validate == "sample":
+        # Images and categories are few compared to the annotations, so they are always validated
+        for image in data["images"]:
+            CocoImage(**image)
+        for category in data["categories"]:
+            CocoKeypointCategory(**category)
+        annotations = data["annotations"]
+        sample = np.random.default_rng().choice(len(annotations), min(sample_size, len(annotations)), replace=False)
+        for index in sample.tolist():
+            CocoKeypointAnnotation(**annotations[index])
+
+
+def _source(path):
+    """The absolute path, size and modification time of a file, which change when it is replaced or modified."""
+    status = os.stat(path)
+    return {"path": os.path.abspath(path), "size": status.st_size, "mtime_ns": status.st_mtime_ns}
+
+
+def _cached_source(cache_path):
+    """The source stored in an .npz cache, or None if it has none or cannot be read. Only that entry is read."""
+    try:
+        with np.load(cache_path, allow_pickle=False) as npz:
+            return json.loads(str(npz["source"]))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_coco_keypoints(
+    path: str, validate="sample", sample_size: int = 1000, cache_path: str = None
+) -> CocoKeypointsArrays:
+    """Load a COCO keypoints JSON file into NumPy arrays.
+
+    Args:
+        path (str): the COCO keypoints JSON file.
+        validate (optional): True to validate the whole file with the pydantic models, "sample" to validate the images,
+                             the categories and a random sample of the annotations, or False to skip validation.
+                             Defaults to "sample".
+        sample_size (int, optional): the amount of annotations that are validated with "sample". Defaults to 1000.
+        cache_path (str, optional): if given, the arrays are saved to this .npz file and loaded from it instead of the
+                                    JSON file, as long as the path, size and modification time of the JSON file
+                                    are the same as when the cache was saved.
+
+    Returns:
+        CocoKeypointsArrays: the dataset.
+    """
+    source = _source(path)
+    if cache_path is not None and os.path.exists(cache_path):
+        if _cached_source(cache_path) == source:
+            return CocoKeypointsArrays.load_npz(cache_path)
+
+    with open(path) as file:
+        data = json.load(file)
+    _validate(data, validate, sample_size)
+    dataset = CocoKeypointsArrays.from_dict(data)
+
+    if cache_path is not None:
+        dataset.save_npz(cache_path, source)
+    return dataset
@@ -0,0 +1,188 @@
+"""Streaming writer for COCO keypoints datasets that are too large to keep in memory.
+
+Each worker appends its images and annotations to its own JSONL shard, with one record per line. The image and
+annotation ids only need to be unique within a shard. merge_coco_shards() then combines the shards into a single
+standard COCO keypoints JSON file with globally unique ids.
+"""
+import glob
+import json
+import os
+from typing import List, Union
+
+from airo_blender_toolkit.coco_parser import (
+    CocoImage,
+    CocoInfo,
+    CocoKeypointAnnotation,
+    CocoKeypointCategory,
+    CocoLicenses,
+)
+
+
+def _as_dict(record):
+    return record.dict() if hasattr(record, "dict") else dict(record)
+
+
+class CocoShardWriter:
+    """Append-only writer of COCO images and annotations to a JSONL shard.
+
+    Only the records that are not yet flushed are kept in memory, and an existing shard is appended to, so a crashed
+    worker can continue where it stopped.
+
+    Example:
+        with abt.CocoShardWriter("dataset/shards", worker_id=3) as writer:
+            writer.write_image(image)
+            writer.write_annotation(annotation)
+    """
+
+    def __init__(self, directory: str, worker_id: int = 0, flush_every: int = 100):
+        """
+        Args:
+            directory (str): the directory of the shards, it is created if needed.
+            worker_id (int, optional): unique id of the worker, which determines the name of its shard. Defaults to 0.
+            flush_every (int, optional): the amount of records after which they are flushed to disk. Defaults to 100.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"shard_{worker_id:05d}.jsonl")
+        self.flush_every = flush_every
+        _remove_unfinished_line(self.path)
+        self._file = open(self.path, "a")
+        self._unflushed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write(self, kind, record):
+        self._file.write(json.dumps({kind: _as_dict(record)}) + "\n")
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def write_image(self, image: Union[CocoImage, dict]):
+        self._write("image", image)
+
+    def write_annotation(self, annotation: Union[CocoKeypointAnnotation, dict]):
+        """Write an annotation. Its image_id must be the id of an image written to the same shard."""
+        self._write("annotation", annotation)
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unflushed = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+def _remove_unfinished_line(path, chunk_size=65536):
+    """Truncates a shard after its last complete line, which drops the unfinished write of a crashed worker. The shard
+    is read backwards from its end in chunks until a newline is found, so only the unfinished line is read."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as file:
+        end = file.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - chunk_size)
+            file.seek(start)
+            chunk = file.read(position - start)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+
+        if position < end:
+            file.truncate(position)
+
+
+def _read_shard(path, kind):
+    """Yields the records of one kind from a shard. A last line without newline is the unfinished write of a crashed
+    worker and is skipped."""
+    with open(path) as file:
+        for line in file:
+            if not line.endswith("\n"):
+                break
+            record = json.loads(line)
+            if kind in record:
+                yield record[kind]
+
+
+def _write_array(file, records):
+    count = 0
+    file.write("[")
+    for record in records:
+        if count > 0:
+            file.write(",")
+        file.write(json.dumps(record))
+        count += 1
+    file.write("]")
+    return count
+
+
+def merge_coco_shards(
+    shards: Union[str, List[str]],
+    output_path: str,
+    categories: List[Union[CocoKeypointCategory, dict]],
+    info: Union[CocoInfo, dict] = None,
+    licenses: List[Union[CocoLicenses, dict]] = None,
+):
+    """Combine JSONL shards into one COCO keypoints JSON file, renumbering the images and annotations from 1.
+
+    The shards are streamed twice, first for the images and then for the annotations, so only the mapping from the
+    original to the new image ids is kept in memory, not the records themselves.
+
+    Args:
+        shards (Union[str, List[str]]): the paths of the shards, or the directory that contains them.
+        output_path (str): path of the COCO JSON file to write.
+        categories (List[Union[CocoKeypointCategory, dict]]): the categories of the dataset.
+        info (Union[CocoInfo, dict], optional): the dataset info.
+        licenses (List[Union[CocoLicenses, dict]], optional): the licenses of the images.
+
+    Returns:
+        tuple: the amount of images and annotations written.
+    """
+    if isinstance(shards, str):
+        shards = sorted(glob.glob(os.path.join(shards, "*.jsonl")))
+
+    image_id_maps = []
+    next_image_id = 1
+
+    def images():
+        nonlocal next_image_id
+        for path in shards:
+            image_id_map = {}
+            for image in _read_shard(path, "image"):
+                image_id_map[image["id"]] = next_image_id
+                image["id"] = next_image_id
+                next_image_id += 1
+                yield image
+            image_id_maps.append(image_id_map)
+
+    def annotations():
+        next_annotation_id = 1
+        for path, image_id_map in zip(shards, image_id_maps):
+            for annotation in _read_shard(path, "annotation"):
+                annotation["id"] = next_annotation_id
+                annotation["image_id"] = image_id_map[annotation["image_id"]]
+                next_annotation_id += 1
+                yield annotation
+
+    with open(output_path, "w") as file:
+        file.write("{")
+        if info is not None:
+            file.write(f'"info": {json.dumps(_as_dict(info))}, ')
+        if licenses is not None:
+            file.write(f'"licenses": {json.dumps([_as_dict(license) for license in licenses])}, ')
+        file.write(f'"categories": {json.dumps([_as_dict(category) for category in categories])}, ')
+        file.write('"images": ')
+        amount_of_images = _write_array(file, images())
+        file.write(', "annotations": ')
+        amount_of_annotations = _write_array(file, annotations())
+        file.write("}\n")
+
+    return amount_of_images, amount_of_annotations
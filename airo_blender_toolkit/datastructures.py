@@ -1,23 +1,151 @@
-import bisect
+import numpy as np
 
 
 class InterpolatingDict(dict):
+    """Dictionary that linearly interpolates between the values of the two keys nearest to the requested key.
+    Keys outside the range of the stored keys are clamped to the first or last value.
+
+    The keys and values are mirrored in sorted NumPy arrays. These are rebuilt lazily after the dictionary is modified,
+    so a lookup costs O(log n) and many keys can be looked up at once with lookup().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._invalidate()
+
+    @classmethod
+    def from_arrays(cls, keys, values):
+        """Build the dictionary and its sorted arrays at once, e.g. from a precomputed lookup table.
+
+        Args:
+            keys (np.ndarray): 1D array with the keys.
+            values (np.ndarray): array with the values, its first dimension must match the amount of keys.
+
+        Returns:
+            InterpolatingDict: the new dictionary.
+        """
+        keys = np.asarray(keys, dtype=float)
+        values = np.asarray(values)
+        if len(keys) != len(values):
+            raise ValueError(f"The amount of keys ({len(keys)}) and values ({len(values)}) must be the same.")
+
+        if np.any(np.diff(keys) < 0.0):
+            order = np.argsort(keys, kind="stable")
+            keys, values = keys[order], values[order]
+        if np.any(np.diff(keys) == 0.0):
+            raise ValueError("The keys must be unique.")
+
+        # Python floats as dict values are much faster to insert than NumPy scalars
+        dict_values = values.tolist() if values.ndim == 1 else values
+        instance = cls(zip(keys.tolist(), dict_values))
+        instance._sorted_keys = keys
+        instance._sorted_values = values
+        return instance
+
+    @classmethod
+    def fromkeys(cls, iterable, value=None):
+        return cls(dict.fromkeys(iterable, value))
+
+    def _invalidate(self):
+        self._sorted_keys = None
+        self._sorted_values = None
+
+    def _sorted_arrays(self):
+        if self._sorted_keys is None:
+            sorted_keys = sorted(self)
+            self._sorted_keys = np.array(sorted_keys, dtype=float)
+            self._sorted_values = np.array([dict.__getitem__(self, key) for key in sorted_keys])
+        return self._sorted_keys, self._sorted_values
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._invalidate()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._invalidate()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._invalidate()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=None):
+        self._invalidate()
+        return super().setdefault(key, default)
+
+    def pop(self, *args):
+        self._invalidate()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._invalidate()
+        return super().popitem()
+
+    def clear(self):
+        super().clear()
+        self._invalidate()
+
     def __getitem__(self, key):
-        sorted_keys = sorted(self)
-        index = bisect.bisect_left(sorted_keys, key)
+        if len(self) == 0:
+            raise KeyError(key)
+
+        sorted_keys, sorted_values = self._sorted_arrays()
+        index = int(np.searchsorted(sorted_keys, key, side="left"))
 
         if index == 0:
-            return dict.__getitem__(self, sorted_keys[0])
+            return sorted_values[0]
 
-        if index == len(self):
-            return dict.__getitem__(self, sorted_keys[-1])
+        if index == len(sorted_keys):
+            return sorted_values[-1]
 
         key_low = sorted_keys[index - 1]
         key_high = sorted_keys[index]
         key_range = key_high - key_low
         fraction_high = (key - key_low) / key_range
         fraction_low = (key_high - key) / key_range
-        value_low = dict.__getitem__(self, key_low)
-        value_high = dict.__getitem__(self, key_high)
+        value_low = sorted_values[index - 1]
+        value_high = sorted_values[index]
         value = fraction_low * value_low + fraction_high * value_high
         return value
+
+    def lookup(self, keys):
+        """Interpolate the values for many keys at once.
+
+        Args:
+            keys (np.ndarray): array of keys of any shape.
+
+        Returns:
+            np.ndarray: the interpolated values, with shape keys.shape + value.shape.
+        """
+        if len(self) == 0:
+            raise KeyError("Cannot look up keys in an empty InterpolatingDict.")
+
+        keys = np.asarray(keys, dtype=float)
+        sorted_keys, sorted_values = self._sorted_arrays()
+
+        if len(sorted_keys) == 1:
+            return np.broadcast_to(sorted_values[0], keys.shape + sorted_values.shape[1:]).copy()
+
+        indices = np.searchsorted(sorted_keys, keys, side="left")
+        indices_high = np.clip(indices, 1, len(sorted_keys) - 1)
+        key_low = sorted_keys[indices_high - 1]
+        key_high = sorted_keys[indices_high]
+        key_range = key_high - key_low
+        fraction_high = (keys - key_low) / key_range
+        fraction_low = (key_high - keys) / key_range
+
+        # Clamp keys outside of the stored range to the first and last value
+        below, above = indices == 0, indices == len(sorted_keys)
+        fraction_high = np.where(below, 0.0, np.where(above, 1.0, fraction_high))
+        fraction_low = np.where(below, 1.0, np.where(above, 0.0, fraction_low))
+
+        value_shape = (1,) * (sorted_values.ndim - 1)
+        fraction_low = fraction_low.reshape(keys.shape + value_shape)
+        fraction_high = fraction_high.reshape(keys.shape + value_shape)
+        value_low = sorted_values[indices_high - 1]
+        value_high = sorted_values[indices_high]
+        return fraction_low * value_low + fraction_high * value_high
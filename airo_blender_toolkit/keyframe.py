@@ -1,21 +1,196 @@
+import warnings
+
 import bpy
+import numpy as np
 from mathutils import Matrix
 
 from airo_blender_toolkit.trajectory import Trajectory
+from airo_blender_toolkit.transform import FrameArray
+
+# Blender's euler rotation modes, e.g. "XYZ" means X is applied first, which is scipy's extrinsic "xyz".
+_euler_orders = {"XYZ", "XZY", "YXZ", "YZX", "ZXY", "ZYX"}
 
 
-def keyframe_trajectory(object: bpy.types.Object, trajectory: Trajectory, start_frame: int, end_frame: int):
+def keyframe_trajectory(
+    object: bpy.types.Object,
+    trajectory: Trajectory,
+    start_frame: int,
+    end_frame: int,
+    bulk: bool = True,
+    position_tolerance: float = None,
+    orientation_tolerance: float = None,
+):
+    """Keyframe the location and rotation of an object along a trajectory, one keyframe per frame in
+    range(start_frame, end_frame).
+
+    Args:
+        object (bpy.types.Object): the object to animate.
+        trajectory (Trajectory): the trajectory that the object should follow.
+        start_frame (int): the first frame of the trajectory.
+        end_frame (int): the trajectory ends the frame before this one.
+        bulk (bool, optional): write all keyframes at once into the fcurves instead of with one keyframe_insert() call
+                               per frame and property. Falls back to keyframe_insert() for objects whose world
+                               pose is not just their location and rotation: parented objects, non-euler rotation
+                               modes, objects with constraints or with a delta transform. Defaults to True.
+        position_tolerance (float, optional): if given, only keep the location keyframes needed to stay within this
+                                              distance (in meters) of the trajectory at every frame. The kept
+                                              keyframes use linear interpolation. Only used when writing in bulk, a
+                                              warning is given when it is ignored.
+        orientation_tolerance (float, optional): same as position_tolerance, but for the euler angles (in radians).
+    """
     frame_range = range(start_frame, end_frame)
-    for frame in frame_range:
-        time_completion = float(frame - start_frame) / (len(frame_range) - 1)
-        pose = trajectory.pose(time_completion)
-        object.matrix_world = Matrix(pose)
-        object.keyframe_insert(data_path="location", frame=frame)
-        object.keyframe_insert(data_path="rotation_euler", frame=frame)
+    if len(frame_range) == 0:
+        return
+
+    # A single frame gets the start of the trajectory
+    time_completions = (np.array(frame_range, dtype=float) - start_frame) / max(len(frame_range) - 1, 1)
+    poses = trajectory.poses(time_completions)
+
+    if bulk and _world_pose_is_local(object):
+        frames = np.array(frame_range, dtype=float)
+        _keyframe_poses_bulk(object, poses, frames, position_tolerance, orientation_tolerance)
+    else:
+        if position_tolerance is not None or orientation_tolerance is not None:
+            warnings.warn(
+                f"Keyframing {object.name} with keyframe_insert(), which keeps every keyframe, so the position and "
+                "orientation tolerances are ignored."
+            )
+        for frame, pose in zip(frame_range, poses):
+            object.matrix_world = Matrix(pose)
+            object.keyframe_insert(data_path="location", frame=frame)
+            object.keyframe_insert(data_path="rotation_euler", frame=frame)
+
     object.matrix_world = Matrix(trajectory.start)
     bpy.context.view_layer.update()
 
 
+def _world_pose_is_local(object):
+    """Whether the world pose of an object is exactly its location and euler rotation, so the poses of a trajectory
+    can be written into those channels directly instead of through matrix_world."""
+    return (
+        object.parent is None
+        and object.rotation_mode in _euler_orders
+        and len(object.constraints) == 0
+        and not any(object.delta_location)
+        and not any(object.delta_rotation_euler)
+    )
+
+
+def _keyframe_poses_bulk(object, poses, frames, position_tolerance=None, orientation_tolerance=None):
+    poses = FrameArray(poses)
+    locations = poses.positions
+    sequence = object.rotation_mode.lower()
+    eulers = poses.as_euler(sequence)
+    eulers = eulers[:, [sequence.index(axis) for axis in "xyz"]]  # rotation_euler always stores x, y, z in order
+
+    # Like setting matrix_world does, keep the eulers compatible with the current rotation and each other, so the
+    # interpolation between keyframes does not spin around by 2 pi.
+    eulers = np.unwrap(np.concatenate((np.array(object.rotation_euler)[np.newaxis], eulers)), axis=0)[1:]
+
+    if object.animation_data is None:
+        object.animation_data_create()
+    if object.animation_data.action is None:
+        object.animation_data.action = bpy.data.actions.new(f"{object.name}Action")
+    action = object.animation_data.action
+
+    channels = (
+        ("location", locations, position_tolerance, "euclidean"),
+        ("rotation_euler", eulers, orientation_tolerance, "maximum"),
+    )
+    for data_path, values, tolerance, error in channels:
+        channel_frames, interpolation = frames, None
+        if tolerance is not None:
+            kept = decimate_keyframes(frames, values, tolerance, error)
+            channel_frames, values, interpolation = frames[kept], values[kept], "LINEAR"
+
+        for index in range(3):
+            fcurve = action.fcurves.find(data_path, index=index)
+            if fcurve is None:
+                fcurve = action.fcurves.new(data_path, index=index, action_group="Object Transforms")
+            write_fcurve(fcurve, channel_frames, values[:, index], interpolation)
+
+    invalidate_keyframe_index(action)
+
+
+def decimate_keyframes(frames: np.ndarray, values: np.ndarray, tolerance: float, error: str = "euclidean"):
+    """Ramer-Douglas-Peucker simplification of keyframes over time. Keeps only the keyframes needed so that linearly
+    interpolating between the kept keyframes stays within the tolerance of the values at all original frames.
+
+    Args:
+        frames (np.ndarray): sorted 1D array with the frames of the keyframes.
+        values (np.ndarray): (N, D) array with the values of the keyframes, e.g. locations or euler angles.
+        tolerance (float): maximum allowed error.
+        error (str, optional): how the error of a D-dimensional value is measured, "euclidean" for the distance or
+                               "maximum" for the largest absolute error of any component. Defaults to "euclidean".
+
+    Returns:
+        np.ndarray: sorted indices of the keyframes to keep, always including the first and the last one.
+    """
+    frames = np.asarray(frames, dtype=float)
+    values = np.asarray(values, dtype=float).reshape(len(frames), -1)
+
+    keep = np.zeros(len(frames), dtype=bool)
+    keep[[0, -1]] = True
+
+    segments = [(0, len(frames) - 1)]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+
+        inner = slice(first + 1, last)
+        fractions = (frames[inner] - frames[first]) / (frames[last] - frames[first])
+        interpolated = values[first] + fractions[:, np.newaxis] * (values[last] - values[first])
+        deviations = values[inner] - interpolated
+        if error == "euclidean":
+            errors = np.linalg.norm(deviations, axis=1)
+        else:
+            errors = np.abs(deviations).max(axis=1)
+
+        worst = int(np.argmax(errors))
+        if errors[worst] > tolerance:
+            middle = first + 1 + worst
+            keep[middle] = True
+            segments += [(first, middle), (middle, last)]
+
+    return np.flatnonzero(keep)
+
+
+def write_fcurve(fcurve: bpy.types.FCurve, frames: np.ndarray, values: np.ndarray, interpolation: str = None):
+    """Write many keyframes into an fcurve at once with foreach_set. Like keyframe_insert(), existing keyframes in the
+    frame range are replaced and the new keyframes use Bezier interpolation with automatic handles.
+
+    Args:
+        fcurve (bpy.types.FCurve): the fcurve to write to.
+        frames (np.ndarray): sorted 1D array with the frames of the keyframes.
+        values (np.ndarray): 1D array with the values of the keyframes.
+        interpolation (str, optional): interpolation mode for the new keyframes, e.g. "LINEAR". Defaults to Bezier.
+    """
+    keyframe_points = fcurve.keyframe_points
+
+    co = np.empty(2 * len(keyframe_points), dtype=np.float32)
+    keyframe_points.foreach_get("co", co)
+    existing_frames = co[0::2]
+    replaced = np.flatnonzero((existing_frames >= frames[0]) & (existing_frames <= frames[-1]))
+    for index in replaced[::-1]:
+        keyframe_points.remove(keyframe_points[int(index)], fast=True)
+
+    amount_existing = len(keyframe_points)
+    keyframe_points.add(len(frames))
+
+    co = np.empty((len(keyframe_points), 2), dtype=np.float32)
+    keyframe_points.foreach_get("co", co.ravel())
+    co[amount_existing:, 0] = frames
+    co[amount_existing:, 1] = values
+    keyframe_points.foreach_set("co", co.ravel())
+
+    if interpolation is not None:
+        for index in range(amount_existing, len(keyframe_points)):
+            keyframe_points[index].interpolation = interpolation
+
+    fcurve.update()  # sorts the keyframes and recalculates the handles
+
+
 def keyframe_visibility(object, start_frame, end_frame):
     object.hide_render = True
     object.hide_viewport = True
@@ -33,12 +208,92 @@ def keyframe_visibility(object, start_frame, end_frame):
     object.keyframe_insert(data_path="hide_viewport", frame=end_frame + 1)
 
 
+class KeyframeIndex:
+    """Sorted array with all frames at which an action has a keyframe, on any of its fcurves."""
+
+    def __init__(self, action: bpy.types.Action):
+        self.signature = _action_signature(action)
+
+        frames = [np.empty(0, dtype=np.float32)]
+        for fcurve in action.fcurves:
+            co = np.empty(2 * len(fcurve.keyframe_points), dtype=np.float32)
+            fcurve.keyframe_points.foreach_get("co", co)
+            frames.append(co[0::2])
+
+        self.frames = np.unique(np.concatenate(frames).astype(int))
+        self._frame_set = set(self.frames.tolist())
+
+    def __contains__(self, frame):
+        if frame != int(frame):  # keyframes are only inserted at whole frames
+            return False
+        return int(frame) in self._frame_set
+
+    def next_keyframe(self, frame):
+        """The first keyframe after the given frame, or None if there is none."""
+        index = np.searchsorted(self.frames, frame, side="right")
+        if index == len(self.frames):
+            return None
+        return int(self.frames[index])
+
+
+def _action_signature(action):
+    """Cheap summary of an action that changes when fcurves or keyframes are added, removed or moved to the ends."""
+    return tuple(
+        (fcurve.data_path, fcurve.array_index, len(fcurve.keyframe_points), tuple(fcurve.range()))
+        for fcurve in action.fcurves
+    )
+
+
+# Keyed by the session_uid of the actions, which unlike their memory address is never reused within a session.
+_keyframe_indices = {}
+
+
+def _remove_deleted_actions():
+    existing = {action.session_uid for action in bpy.data.actions}
+    for key in [key for key in _keyframe_indices if key not in existing]:
+        del _keyframe_indices[key]
+
+
+def keyframe_index(action: bpy.types.Action) -> KeyframeIndex:
+    """Get the keyframe index of an action. It is built once and rebuilt when the action changes.
+
+    Changes that do not alter the amount of keyframes or the frame range of an fcurve (e.g. moving a single keyframe in
+    the middle of an fcurve) are not detected, call invalidate_keyframe_index() after making such changes.
+    """
+    key = action.session_uid
+    index = _keyframe_indices.get(key)
+    if index is None or index.signature != _action_signature(action):
+        index = KeyframeIndex(action)
+        _keyframe_indices[key] = index
+        if len(_keyframe_indices) > len(bpy.data.actions):
+            _remove_deleted_actions()
+    return index
+
+
+def invalidate_keyframe_index(action: bpy.types.Action = None):
+    """Forget the keyframe index of an action, or of all actions if none is given."""
+    if action is None:
+        _keyframe_indices.clear()
+    else:
+        _keyframe_indices.pop(action.session_uid, None)
+
+
+def _action(object):
+    if object.animation_data is None:
+        return None
+    return object.animation_data.action
+
+
 def is_keyframed(object, frame):
-    if object.animation_data is None or object.animation_data.action is None:
+    action = _action(object)
+    if action is None:
         return False
+    return frame in keyframe_index(action)
 
-    for fcurve in object.animation_data.action.fcurves:
-        if frame in (int(p.co.x) for p in fcurve.keyframe_points):
-            return True
 
-    return False
+def next_keyframe(object, frame):
+    """The first frame after the given frame at which the object has a keyframe, or None if there is none."""
+    action = _action(object)
+    if action is None:
+        return None
+    return keyframe_index(action).next_keyframe(frame)
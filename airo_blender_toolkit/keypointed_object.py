@@ -1,10 +1,78 @@
+import os
 from typing import List
 
 import bpy
-from bpy_extras.object_utils import world_to_camera_view
+import numpy as np
 from mathutils import Color
 
 import airo_blender_toolkit as abt
+from airo_blender_toolkit.visible_vertices import _local_vertex_coordinates, _vertex_coordinates
+
+# Incremented on every depsgraph update and frame change, so cached keypoints can tell if they may be outdated.
+_depsgraph_update_count = 0
+
+
+@bpy.app.handlers.persistent
+def _count_depsgraph_update(scene, depsgraph=None):
+    global _depsgraph_update_count
+    _depsgraph_update_count += 1
+
+
+def _register_depsgraph_update_counter():
+    for handlers in (bpy.app.handlers.depsgraph_update_post, bpy.app.handlers.frame_change_post):
+        if _count_depsgraph_update not in handlers:
+            handlers.append(_count_depsgraph_update)
+
+
+def _allocate(shape, dtype, directory=None, name=None):
+    """An uninitialized array, or a memory-mapped .npy file named after the array if a directory is given."""
+    if directory is None:
+        return np.empty(shape, dtype=dtype)
+    os.makedirs(directory, exist_ok=True)
+    return np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode="w+", dtype=dtype, shape=shape)
+
+
+class KeypointSnapshot:
+    """The keypoints of an object at one moment, with the views derived from them cached per camera."""
+
+    def __init__(self, names: List[str], local_coordinates: np.ndarray, matrix_world: np.ndarray, key=None):
+        """
+        Args:
+            names (List[str]): the names of the keypoints.
+            local_coordinates (np.ndarray): (N, 3) array with the object space coordinates of the keypoints.
+            matrix_world (np.ndarray): (4, 4) world matrix of the object, the projections use world space coordinates.
+            key (tuple, optional): the (frame, depsgraph update count) at which the keypoints were read.
+        """
+        self.names = names
+        self.local_coordinates = np.asarray(local_coordinates, dtype=float)
+        self.coordinates = self.local_coordinates @ matrix_world[:3, :3].T + matrix_world[:3, 3]
+        self.key = key
+        self._visible_masks = {}
+        self._view_coordinates = {}
+        self._pixels = {}
+
+    def as_dict(self) -> dict:
+        """Keypoint name -> object space coordinates."""
+        return dict(zip(self.names, self.local_coordinates))
+
+    def visible_mask(self, camera) -> np.ndarray:
+        """(N,) boolean mask with the visibility of the keypoints from the camera."""
+        if camera.name not in self._visible_masks:
+            self._visible_masks[camera.name] = abt.are_visible(self.coordinates, camera)
+        return self._visible_masks[camera.name]
+
+    def view_coordinates(self, camera) -> np.ndarray:
+        """(N, 3) array with the normalized image coordinates and depths of the keypoints, see
+        abt.project_to_cameras()."""
+        if camera.name not in self._view_coordinates:
+            self._view_coordinates[camera.name] = abt.project_to_cameras(self.coordinates, [camera])[0]
+        return self._view_coordinates[camera.name]
+
+    def pixels(self, camera):
+        """(N, 2) array with the pixel coordinates and (N,) array with the depths of the keypoints."""
+        if camera.name not in self._pixels:
+            self._pixels[camera.name] = abt.project_points(self.coordinates, camera)
+        return self._pixels[camera.name]
 
 
 class KeypointedObject:
@@ -12,74 +80,173 @@ class KeypointedObject:
     Trying this for now but not sure if it's worth it.
     """
 
+    _keypoint_snapshot = None
+
     def __init__(self, keypoint_ids: dict[str, list[int]]):
         self.keypoint_ids = keypoint_ids
 
     @property
-    def keypoints_3D(self):
-        # TODO change this because self.blender_object only avaible when also blender object
-        vertices = self.blender_object.evaluated_get(bpy.context.evaluated_depsgraph_get()).data.vertices
-        keypoints = {}
+    def keypoint_snapshot(self) -> KeypointSnapshot:
+        """The keypoints at the current frame. The depsgraph is evaluated and the keypoints are read only once, until
+        the frame changes or the depsgraph is updated. Call invalidate_keypoints() after changes that Blender does not
+        report to the depsgraph.
+        """
+        _register_depsgraph_update_counter()
+        depsgraph = bpy.context.evaluated_depsgraph_get()  # evaluating pending changes updates the counter
+        key = (bpy.context.scene.frame_current, _depsgraph_update_count)
+
+        if self._keypoint_snapshot is None or self._keypoint_snapshot.key != key:
+            # TODO change this because self.blender_object only avaible when also blender object
+            evaluated_object = self.blender_object.evaluated_get(depsgraph)
+            coordinates = _local_vertex_coordinates(evaluated_object)[list(self.keypoint_ids.values())]
+            matrix_world = np.array(evaluated_object.matrix_world)
+            self._keypoint_snapshot = KeypointSnapshot(list(self.keypoint_ids.keys()), coordinates, matrix_world, key)
+        return self._keypoint_snapshot
 
-        for key, vertex_id in self.keypoint_ids.items():
-            keypoints[key] = vertices[vertex_id].co
-        return keypoints
+    def invalidate_keypoints(self):
+        """Read the keypoints again on the next access."""
+        self._keypoint_snapshot = None
+
+    def track_keypoints(self, frame_start: int, frame_end: int, cameras=None, output_directory: str = None) -> dict:
+        """Read the keypoints at every frame in range(frame_start, frame_end) and project them into several cameras.
+
+        Every frame is evaluated once, the keypoints are read with foreach_get and the occluding geometry is kept in a
+        VisibilityContext, so only objects whose geometry changes get a new BVH tree. The current frame is restored
+        afterwards, also when an error occurs.
+
+        Args:
+            frame_start (int): the first frame.
+            frame_end (int): the tracking ends the frame before this one.
+            cameras (list, optional): the camera objects. Defaults to the scene camera.
+            output_directory (str, optional): if given, the arrays are memory-mapped .npy files in this directory
+                                              instead of in memory, e.g. for long sequences.
+
+        Returns:
+            dict: with the arrays "frames" (F,), "positions" (F, K, 3) in world space, "pixels" (F, C, K, 2),
+                  "depths" (F, C, K) and "visible" (F, C, K), for F frames, C cameras and K keypoints.
+        """
+        scene = bpy.context.scene
+        cameras = [KeypointedObject._default_camera()] if cameras is None else list(cameras)
+        frames = np.arange(frame_start, frame_end)
+        vertex_ids = list(self.keypoint_ids.values())
+        shapes = {
+            "positions": ((len(frames), len(vertex_ids), 3), np.float64),
+            "pixels": ((len(frames), len(cameras), len(vertex_ids), 2), np.float64),
+            "depths": ((len(frames), len(cameras), len(vertex_ids)), np.float64),
+            "visible": ((len(frames), len(cameras), len(vertex_ids)), bool),
+        }
+        track = {"frames": frames}
+        for name, (shape, dtype) in shapes.items():
+            track[name] = _allocate(shape, dtype, output_directory, name)
+
+        original_frame = scene.frame_current
+        try:
+            with abt.VisibilityContext() as visibility_context:
+                for i, frame in enumerate(frames.tolist()):
+                    scene.frame_set(frame)
+                    depsgraph = bpy.context.evaluated_depsgraph_get()
+                    positions = _vertex_coordinates(self.blender_object.evaluated_get(depsgraph))[vertex_ids]
+                    track["positions"][i] = positions
+                    for j, camera in enumerate(cameras):
+                        track["pixels"][i, j], track["depths"][i, j] = abt.project_points(positions, camera, scene)
+                    track["visible"][i] = abt.are_visible_from_cameras(
+                        positions, cameras, visibility_context=visibility_context
+                    )
+        finally:
+            scene.frame_set(original_frame)
+
+        if output_directory is not None:
+            np.save(os.path.join(output_directory, "frames.npy"), frames)
+            for name in shapes:
+                track[name].flush()
+        return track
+
+    @property
+    def keypoints_3D(self):
+        """Keypoint name -> coordinates in the object space of the mesh."""
+        return self.keypoint_snapshot.as_dict()
 
     @property
     def keypoints_3D_visible(self):
-        keypoints_3D_visible = {}
-        for key, coord in self.keypoints_3D.items():
-            keypoints_3D_visible[key] = abt.is_visible(coord)
-        return keypoints_3D_visible
+        snapshot = self.keypoint_snapshot
+        visible = snapshot.visible_mask(KeypointedObject._default_camera())
+        return dict(zip(snapshot.names, visible.tolist()))
 
     @property
     def keypoints_2D(self):
-        return KeypointedObject.project_to_camera(self.keypoints_3D)
+        snapshot = self.keypoint_snapshot
+        return dict(zip(snapshot.names, snapshot.view_coordinates(KeypointedObject._default_camera())))
 
     @property
     def keypoints_2D_visible(self):
         return KeypointedObject.project_to_camera(self.keypoints_3D_visible)
 
+    def keypoints_3D_visible_from_cameras(self, cameras) -> np.ndarray:
+        """Visibility of the keypoints from each of several cameras.
+
+        Args:
+            cameras (list): the camera objects.
+
+        Returns:
+            np.ndarray: (n_cameras, n_keypoints) boolean mask, the keypoints in the order of keypoint_ids.
+        """
+        snapshot = self.keypoint_snapshot
+        return np.array([snapshot.visible_mask(camera) for camera in cameras]).reshape(len(cameras), -1)
+
     @staticmethod
-    def project_to_camera(keypoints):
-        # TODO support multiview, add camera arg to keypoints_2D
+    def _default_camera():
         scene = bpy.context.scene
-
         if scene.camera is None:
             scene.camera = scene.objects["Camera"]
+        return scene.camera
 
-        camera = scene.camera
-        keypoints_2D = {}
+    @staticmethod
+    def project_to_camera(keypoints, camera=None):
+        camera = KeypointedObject._default_camera() if camera is None else camera
+        projections = KeypointedObject.project_to_cameras(keypoints, [camera])[0]
+        return dict(zip(keypoints.keys(), projections))
 
-        for key, coord in keypoints.items():
-            keypoints_2D[key] = world_to_camera_view(scene, camera, coord)
-        return keypoints_2D
+    @staticmethod
+    def project_to_cameras(keypoints, cameras) -> np.ndarray:
+        """Projects keypoints into the views of several cameras at once, see abt.project_to_cameras().
 
-    @property
-    def coco_keypoints(self) -> List[float]:
-        # Because coco wants coords in pixel space, we need the image dimensions here
-        scene = bpy.context.scene
-        image_width = scene.render.resolution_x
-        image_height = scene.render.resolution_y
+        Args:
+            keypoints (dict): keypoint name -> world space coordinate.
+            cameras (list): the camera objects.
 
-        coco_keypoints_list = []
+        Returns:
+            np.ndarray: (n_cameras, n_keypoints, 3) array with the normalized image coordinates and depths.
+        """
+        coords = np.array([tuple(coord) for coord in keypoints.values()]).reshape(-1, 3)
+        return abt.project_to_cameras(coords, cameras)
 
-        for name, coord in self.keypoints_2D.items():
-            u, v, _ = coord
-            px = image_width * u
-            py = image_height * (1.0 - v)
-            visible_flag = 2
+    @property
+    def coco_keypoints(self) -> List[float]:
+        # Because coco wants coords in pixel space, all keypoints are projected to pixels at once
+        pixels, depths = self.keypoint_snapshot.pixels(KeypointedObject._default_camera())
 
-            if px < 0 or py < 0 or px > image_width or py > image_height:
-                visible_flag = 0
-                px = 0.0
-                py = 0.0
+        in_image = abt.in_image_mask(pixels, depths)
+        pixels = np.where(in_image[:, np.newaxis], pixels, 0.0)
+        visible_flags = np.where(in_image, 2, 0).tolist()
 
+        coco_keypoints_list = []
+        for (px, py), visible_flag in zip(pixels.tolist(), visible_flags):
             coco_keypoints_list += [px, py, visible_flag]
 
         return coco_keypoints_list
 
     def json_ready_keypoints(self, dimension=2, only_visible=True):
+        """The keypoints as a JSON serializable dict, with the dimension and visibility as suffix of the names.
+
+        Args:
+            dimension (int, optional): 2 for the keypoints in the view of the scene camera, 3 for the 3D keypoints
+                                       in the object space of the mesh. Defaults to 2.
+            only_visible (bool, optional): use the keypoints_2D_visible or keypoints_3D_visible properties.
+                                           Defaults to True.
+
+        Returns:
+            dict: keypoint name with suffix -> list.
+        """
         if dimension == 2 and only_visible:
             keypoints = self.keypoints_2D_visible
             suffix = "_keypoints_visible"
@@ -99,7 +266,8 @@ class KeypointedObject:
         return keypoints_json
 
     def visualize_keypoints(self, radius=0.02, keypoints_color=None):
-        n = len(self.keypoints_3D.keys())
+        keypoints_3D = self.keypoints_3D
+        n = len(keypoints_3D.keys())
 
         hues = [float(i) / n for i in range(n)]
 
@@ -109,7 +277,7 @@ class KeypointedObject:
             color.hsv = hue, 1.0, 1.0
             colors.append(color)
 
-        for color, (category, keypoint) in zip(colors, self.keypoints_3D.items()):
+        for color, (category, keypoint) in zip(colors, keypoints_3D.items()):
             if keypoints_color:
                 color = keypoints_color
 
@@ -0,0 +1,302 @@
+"""COCO bounding boxes, areas and segmentation masks of objects, computed from their projected meshes."""
+import warnings
+
+import bpy
+import numpy as np
+
+from airo_blender_toolkit.projection import _project, image_resolution, view_projection_matrix
+from airo_blender_toolkit.visible_vertices import _evaluated_triangles
+
+
+def rasterize_triangles(triangles: np.ndarray, width: int, height: int, batch_size: int = 1000000) -> np.ndarray:
+    """Rasterizes 2D triangles into a boolean mask. A pixel is covered when its center lies inside a triangle.
+
+    The candidate pixels, those in the bounding boxes of the triangles, are tested at once for batches of triangles
+    with about batch_size candidates in total, so the cost scales with the covered image area instead of with a Python
+    loop over the triangles, while the memory use stays bounded.
+
+    Args:
+        triangles (np.ndarray): (T, 3, 2) array with the pixel coordinates of the triangle corners, measured from the
+                                top left corner of the image.
+        width (int): width of the mask.
+        height (int): height of the mask.
+        batch_size (int, optional): the amount of candidate pixels tested at once. A triangle with more candidates is
+                                    tested on its own. Defaults to 1000000.
+
+    Returns:
+        np.ndarray: (height, width) boolean mask.
+    """
+    mask = np.zeros((height, width), dtype=bool)
+    for _, _, rows, columns, _ in _covered_pixels(triangles, width, height, batch_size):
+        mask[rows, columns] = True
+    return mask
+
+
+def rasterize_depth(
+    triangles: np.ndarray,
+    depths: np.ndarray,
+    width: int,
+    height: int,
+    perspective: bool = True,
+    batch_size: int = 1000000,
+) -> np.ndarray:
+    """Rasterizes 2D triangles with a depth per corner into a z-buffer, see rasterize_triangles().
+
+    Args:
+        triangles (np.ndarray): (T, 3, 2) array with the pixel coordinates of the triangle corners.
+        depths (np.ndarray): (T, 3) array with the depths of the corners, which must be positive for perspective
+                             cameras, e.g. by clipping the triangles against the near plane first.
+        width (int): width of the z-buffer.
+        height (int): height of the z-buffer.
+        perspective (bool, optional): whether the triangles were projected by a perspective camera, in which case the
+                                      inverse depth is interpolated, which is linear in image space. Otherwise the
+                                      depth itself is. Defaults to True.
+        batch_size (int, optional): the amount of candidate pixels tested at once. Defaults to 1000000.
+
+    Returns:
+        np.ndarray: (height, width) array with the depth of the nearest triangle at each pixel, inf where no triangle
+                    covers the pixel.
+    """
+    buffer = np.full((height, width), np.inf)
+    depths = np.asarray(depths, dtype=float).reshape(-1, 3)
+    for batch, triangle_indices, rows, columns, weights in _covered_pixels(triangles, width, height, batch_size):
+        corner_depths = depths[batch][triangle_indices]
+        if perspective:
+            values = 1.0 / np.sum(weights / corner_depths, axis=1)
+        else:
+            values = np.sum(weights * corner_depths, axis=1)
+        valid = np.isfinite(values)  # degenerate triangles have no weights
+        np.minimum.at(buffer, (rows[valid], columns[valid]), values[valid])
+    return buffer
+
+
+def _covered_pixels(triangles, width, height, batch_size):
+    """Yields the covered pixels of consecutive batches of triangles, as the slice of the batch, the index of the
+    covering triangle within the batch, the row and column of the pixel and the barycentric weights of its center."""
+    triangles = np.asarray(triangles, dtype=float).reshape(-1, 3, 2)
+
+    # Range of the pixels whose centers (x + 0.5, y + 0.5) lie in the bounding box of each triangle
+    low = np.clip(np.ceil(triangles.min(axis=1) - 0.5), 0, (width, height)).astype(int)
+    high = np.clip(np.floor(triangles.max(axis=1) - 0.5) + 1, 0, (width, height)).astype(int)
+    sizes = np.maximum(high - low, 0)
+    counts = sizes[:, 0] * sizes[:, 1]
+
+    ends = np.cumsum(counts)
+    start = 0
+    while start < len(triangles):
+        offset = ends[start] - counts[start]
+        end = max(int(np.searchsorted(ends, offset + batch_size, side="right")), start + 1)
+        batch = slice(start, end)
+        start = end
+
+        triangle_indices = np.repeat(np.arange(batch.stop - batch.start), counts[batch])
+        if len(triangle_indices) == 0:
+            continue
+
+        local_indices = np.arange(len(triangle_indices)) - np.repeat(
+            np.cumsum(counts[batch]) - counts[batch], counts[batch]
+        )
+        batch_low, batch_sizes = low[batch][triangle_indices], sizes[batch][triangle_indices]
+        columns = batch_low[:, 0] + local_indices % batch_sizes[:, 0]
+        rows = batch_low[:, 1] + local_indices // batch_sizes[:, 0]
+        centers = np.column_stack((columns + 0.5, rows + 0.5))
+
+        # The center is inside if it lies on the same side of all three edges, for either winding of the triangle
+        corners = triangles[batch][triangle_indices]
+        sides = np.empty((len(centers), 3))
+        for i in range(3):
+            edge_start, edge_end = corners[:, i], corners[:, (i + 1) % 3]
+            edge, edge_offset = edge_end - edge_start, centers - edge_start
+            sides[:, i] = edge[:, 0] * edge_offset[:, 1] - edge[:, 1] * edge_offset[:, 0]
+        inside = np.all(sides >= 0.0, axis=1) | np.all(sides <= 0.0, axis=1)
+
+        # The edge function of an edge is proportional to the weight of the opposite corner
+        sides = sides[inside]
+        totals = sides.sum(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weights = sides[:, [1, 2, 0]] / totals
+        yield batch, triangle_indices[inside], rows[inside], columns[inside], weights
+
+
+def _clip_triangles(corners: np.ndarray, depths: np.ndarray, near: float) -> np.ndarray:
+    """Clips 3D triangles against the near plane of a camera, so they can be projected without wrapping around.
+
+    Args:
+        corners (np.ndarray): (T, 3, 3) array with the world space corners of the triangles.
+        depths (np.ndarray): (T, 3) array with the depths of the corners along the viewing direction of the camera.
+        near (float): the depth of the near plane.
+
+    Returns:
+        np.ndarray: (M, 3, 3) array with the parts of the triangles in front of the near plane. A triangle with one
+                    corner behind the plane becomes two triangles, one with two corners behind it becomes a smaller
+                    triangle and one that is completely behind it is dropped.
+    """
+    in_front = depths > near
+    amount_in_front = np.count_nonzero(in_front, axis=1)
+
+    # Roll the corners so the one that is on the other side of the plane than the two others comes first
+    partial = (amount_in_front == 1) | (amount_in_front == 2)
+    odd = np.where(
+        amount_in_front[partial] == 1, np.argmax(in_front[partial], axis=1), np.argmin(in_front[partial], axis=1)
+    )
+    order = (odd[:, np.newaxis] + np.arange(3)) % 3
+    rolled_corners = np.take_along_axis(corners[partial], order[:, :, np.newaxis], axis=1)
+    rolled_depths = np.take_along_axis(depths[partial], order, axis=1)
+
+    def cut(i, j):
+        # Depths are affine in world space, so the intersection is found by interpolating them along the edge
+        fractions = (near - rolled_depths[:, i]) / (rolled_depths[:, j] - rolled_depths[:, i])
+        return rolled_corners[:, i] + fractions[:, np.newaxis] * (rolled_corners[:, j] - rolled_corners[:, i])
+
+    a, b, c = rolled_corners[:, 0], rolled_corners[:, 1], rolled_corners[:, 2]
+    a_b, a_c = cut(0, 1), cut(0, 2)
+    only_a = amount_in_front[partial] == 1
+    without_a = ~only_a
+
+    return np.concatenate(
+        (
+            corners[amount_in_front == 3],
+            np.stack((a, a_b, a_c), axis=1)[only_a],
+            np.stack((a_b, b, c), axis=1)[without_a],
+            np.stack((a_b, c, a_c), axis=1)[without_a],
+        )
+    )
+
+
+def mask_to_rle(mask: np.ndarray) -> dict:
+    """Uncompressed COCO run-length encoding of a mask, the runs alternate between background and foreground in
+    column-major order, starting with background.
+
+    Args:
+        mask (np.ndarray): (height, width) boolean mask.
+
+    Returns:
+        dict: with the run lengths as "counts" and the [height, width] as "size".
+    """
+    pixels = np.asarray(mask, dtype=bool).ravel(order="F")
+    changes = np.flatnonzero(pixels[1:] != pixels[:-1]) + 1
+    boundaries = np.concatenate(([0], changes, [len(pixels)]))
+    counts = np.diff(boundaries).tolist()
+    if len(pixels) > 0 and pixels[0]:
+        counts = [0] + counts
+    return {"counts": counts, "size": list(mask.shape)}
+
+
+def rle_to_mask(rle: dict) -> np.ndarray:
+    """Decodes an uncompressed COCO run-length encoding, see mask_to_rle()."""
+    height, width = rle["size"]
+    values = np.arange(len(rle["counts"])) % 2 == 1
+    pixels = np.repeat(values, rle["counts"])
+    return pixels.reshape((height, width), order="F")
+
+
+def mask_bbox(mask: np.ndarray) -> list:
+    """The COCO bounding box [x, y, width, height] of the foreground pixels of a mask, or all zeros if it is empty."""
+    rows, columns = np.any(mask, axis=1), np.any(mask, axis=0)
+    if not np.any(rows):
+        return [0, 0, 0, 0]
+    y_min, y_max = np.flatnonzero(rows)[[0, -1]]
+    x_min, x_max = np.flatnonzero(columns)[[0, -1]]
+    return [int(x_min), int(y_min), int(x_max - x_min + 1), int(y_max - y_min + 1)]
+
+
+def _triangles_depth(vertices, triangles, view_projection, near, perspective, window):
+    """Z-buffer of world space triangles in the part of the image given by the (x, y, width, height) window."""
+    _, depths = _project(vertices, view_projection)
+    corners = _clip_triangles(vertices[triangles], depths[triangles], near)
+    pixels, corner_depths = _project(corners.reshape(-1, 3), view_projection)
+    x, y, width, height = window
+    pixels -= (x, y)
+    return rasterize_depth(pixels.reshape(-1, 3, 2), corner_depths.reshape(-1, 3), width, height, perspective)
+
+
+def _scene_depth(obj, depsgraph, view_projection, near, perspective, window):
+    """Z-buffer of all evaluated, visible geometry in the scene except the object itself, see _triangles_depth()."""
+    x, y, width, height = window
+    depth = np.full((height, width), np.inf)
+    for instance in depsgraph.object_instances:
+        if not instance.is_instance and instance.object.original == obj:
+            continue
+        vertices, triangles = _evaluated_triangles(instance.object, np.array(instance.matrix_world))
+        if vertices is None or len(triangles) == 0:
+            continue
+        depth = np.minimum(depth, _triangles_depth(vertices, triangles, view_projection, near, perspective, window))
+    return depth
+
+
+def _depth_map_depth(depth_map, camera_obj, window, image_size):
+    """The depths of a depth map at the centers of the pixels in the window, the depth map may have a lower
+    resolution than the image."""
+    if depth_map.camera_name != camera_obj.name:
+        raise ValueError(f"The depth map was rendered from {depth_map.camera_name}, not from {camera_obj.name}.")
+    if bpy.context.scene.frame_current != depth_map.frame:
+        warnings.warn(
+            f"The depth map was rendered at frame {depth_map.frame}, but the current frame is "
+            f"{bpy.context.scene.frame_current}."
+        )
+
+    x, y, width, height = window
+    image_width, image_height = image_size
+    depth_height, depth_width = depth_map.depth.shape
+    rows = ((np.arange(y, y + height) + 0.5) * depth_height / image_height).astype(int)
+    columns = ((np.arange(x, x + width) + 0.5) * depth_width / image_width).astype(int)
+    return depth_map.depth[np.clip(rows, 0, depth_height - 1)][:, np.clip(columns, 0, depth_width - 1)]
+
+
+def mesh_annotation(obj, camera_obj=None, only_visible: bool = False, depth_map=None, tolerance: float = 0.01) -> dict:
+    """The COCO bounding box, area and segmentation of an object in the image of a camera.
+
+    The evaluated mesh is read with foreach_get, its triangles are clipped against the near clipping plane of the
+    camera, like Blender does when rendering, and all their corners are projected at once and rasterized into a
+    z-buffer of the object. The pixels it covers form the instance mask.
+
+    Args:
+        obj: the object, a bpy.types.Object or a BlenderObject.
+        camera_obj (bpy.types.Object, optional): the camera. Defaults to the scene camera.
+        only_visible (bool, optional): only keep the pixels where the object is in front of all other geometry, so
+                                       the parts of the object that are hidden behind other objects are left out.
+                                       The other objects are rasterized into a z-buffer within the bounding box of
+                                       the object, unless a depth_map is given. Defaults to False.
+        depth_map (DepthMap, optional): depth map rendered from the camera at the current frame, to compare the
+                                        depth of the object with instead of rasterizing the scene.
+        tolerance (float, optional): how far (in meters) the object may lie behind the depth map and still be
+                                     visible, see DepthMap.visible_mask(). Defaults to 0.01.
+
+    Returns:
+        dict: with the "bbox" [x, y, width, height] of the mask, its "area" in pixels, the "segmentation" as an
+              uncompressed COCO RLE and the boolean "mask" itself.
+    """
+    obj = getattr(obj, "blender_object", obj)
+    scene = bpy.context.scene
+    camera_obj = scene.camera if camera_obj is None else camera_obj
+    width, height = image_resolution(scene)
+    view_projection = view_projection_matrix(camera_obj, scene)
+    near, perspective = camera_obj.data.clip_start, camera_obj.data.type != "ORTHO"
+
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    evaluated_obj = obj.evaluated_get(depsgraph)
+    vertices, triangles = _evaluated_triangles(evaluated_obj, np.array(evaluated_obj.matrix_world))
+    if vertices is None:
+        triangles = np.empty((0, 3), dtype=int)
+        vertices = np.empty((0, 3))
+
+    image = (0, 0, width, height)
+    depth = _triangles_depth(vertices, triangles, view_projection, near, perspective, image)
+    mask = np.isfinite(depth)
+
+    if only_visible and np.any(mask):
+        # Only the occluders within the bounding box of the object matter
+        x, y, box_width, box_height = window = mask_bbox(mask)
+        box = slice(y, y + box_height), slice(x, x + box_width)
+        if depth_map is None:
+            occluder_depth = _scene_depth(obj, depsgraph, view_projection, near, perspective, window)
+        else:
+            occluder_depth = _depth_map_depth(depth_map, camera_obj, window, (width, height)) + tolerance
+        mask[box] &= depth[box] <= occluder_depth
+
+    return {
+        "bbox": mask_bbox(mask),
+        "area": float(np.count_nonzero(mask)),
+        "segmentation": mask_to_rle(mask),
+        "mask": mask,
+    }
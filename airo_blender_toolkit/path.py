@@ -1,63 +1,206 @@
 from abc import ABC, abstractmethod
 
 import numpy as np
+from scipy.interpolate import BSpline
 from scipy.spatial.transform import Rotation, Slerp
+from scipy.stats import binom
 
 import airo_blender_toolkit as abt
 
 
 class CartesianPath(ABC):
+    # When set, the arc-length table is built adaptively to this absolute tolerance (in meters) instead of with a fixed
+    # amount of steps. Can be overridden per subclass or per instance before the table is built.
+    arc_length_tolerance = None
+
     def __init__(self):
-        self.init_completion_to_parameter_map()
+        # The arc-length table is only built when it is first needed, so paths that are discarded cost nothing.
+        self._completion_to_parameter_map = None
+
+    def prepare(self, steps=1000, tolerance=None):
+        """Build the arc-length table now instead of on the first pose() call, e.g. to warm up before keyframing.
+
+        Args:
+            steps (int, optional): amount of evenly spaced samples, used when no tolerance is given. Defaults to 1000.
+            tolerance (float, optional): absolute arc length tolerance. Defaults to the arc_length_tolerance attribute.
+
+        Returns:
+            CartesianPath: the path itself, to allow chaining.
+        """
+        if tolerance is None:
+            tolerance = self.arc_length_tolerance
+        self.init_completion_to_parameter_map(steps=steps, tolerance=tolerance)
+        return self
+
+    @property
+    def completion_to_parameter_map(self):
+        if self._completion_to_parameter_map is None:
+            self.prepare()
+        return self._completion_to_parameter_map
 
     def pose(self, path_completion):
         path_parameter = self.map(path_completion)
         return self._pose(path_parameter)
 
+    def poses(self, path_completions):
+        """Get many poses along the path at once.
+
+        Args:
+            path_completions (np.ndarray): 1D array of path completions between 0 and 1
+
+        Returns:
+            FrameArray: (N, 4, 4) array with the poses
+        """
+        path_completions = np.asarray(path_completions, dtype=float)
+        path_parameters = self.completion_to_parameter_map.lookup(path_completions)
+        return abt.FrameArray(self._poses(path_parameters))
+
     @abstractmethod
     def _pose(self, path_parameter=0.5):
         pass
 
+    def _poses(self, path_parameters):
+        """Vectorized version of _pose(). Subclasses should override this fallback that calls _pose() per parameter.
+
+        Args:
+            path_parameters (np.ndarray): 1D array of path parameters between 0 and 1
+
+        Returns:
+            np.ndarray: (N, 4, 4) array with the poses
+        """
+        return np.array([self._pose(path_parameter) for path_parameter in path_parameters]).reshape(-1, 4, 4)
+
     @property
     def start(self):
-        return self.pose(0.0)
+        # Completion 0 and 1 always map to the same path parameter, so no arc-length table is needed
+        return self._pose(0.0)
 
     @property
     def end(self):
-        return self.pose(1.0)
+        return self._pose(1.0)
 
     def map(self, path_completion):
         path_parameter = self.completion_to_parameter_map[path_completion]
         # path_parameter = path_completion
         return path_parameter
 
-    def path_length(self, steps=1000):
-        p = self._pose(0.0).position
-        cumulative_distance = 0.0
-        for path_parameter in np.linspace(1.0 / steps, 1, steps):
-            p_next = self._pose(path_parameter).position
-            cumulative_distance += np.linalg.norm(p_next - p)
-            p = p_next
-        return cumulative_distance
-
-    def init_completion_to_parameter_map(self, steps=1000):
-        map = abt.InterpolatingDict()
-        map[0.0] = 0.0
-
-        p = self._pose(0.0).position
-        cumulative_distance = 0.0
-        path_length = self.path_length(steps=steps)
-
-        for path_parameter in np.linspace(1.0 / steps, 1, steps):
-            p_next = self._pose(path_parameter).position
-            cumulative_distance += np.linalg.norm(p_next - p)
-            cumulative_distance_fraction = cumulative_distance / path_length
-            map[cumulative_distance_fraction] = path_parameter
-            p = p_next
-
-        self.completion_to_parameter_map = map
+    def arc_length_table(self, steps=1000):
+        """Sample the path at evenly spaced path parameters and accumulate the distance between the samples.
+
+        Args:
+            steps (int, optional): amount of line segments used to approximate the path. Defaults to 1000.
+
+        Returns:
+            tuple: two arrays of length steps + 1, the path parameters and the arc length up to each of them.
+        """
+        path_parameters = np.linspace(0, 1, steps + 1)
+        positions = self._poses(path_parameters)[:, 0:3, 3]
+        segment_lengths = np.linalg.norm(np.diff(positions, axis=0), axis=1)
+        arc_lengths = np.concatenate(([0.0], np.cumsum(segment_lengths)))
+        return path_parameters, arc_lengths
+
+    def adaptive_arc_length_table(self, tolerance=1e-4, initial_steps=4, max_depth=16):
+        """Build an arc-length table with only as many knots as needed to reach a given tolerance.
+
+        Intervals are recursively halved until both the length of the interval and the arc length at its midpoint are
+        known within the tolerance. The length of an interval is estimated from its chord and the chords of its two
+        halves with Richardson extrapolation. All midpoints of a subdivision level are evaluated in one _poses() call.
+
+        Args:
+            tolerance (float, optional): absolute arc length tolerance in meters. Defaults to 1e-4.
+            initial_steps (int, optional): amount of intervals to start from. Defaults to 4.
+            max_depth (int, optional): maximum amount of times an interval can be halved. Defaults to 16.
+
+        Returns:
+            tuple: two arrays, the path parameters of the knots and the arc length up to each of them.
+        """
+        path_parameters = np.linspace(0, 1, initial_steps + 1)
+        positions = self._poses(path_parameters)[:, 0:3, 3]
+        t0, t1 = path_parameters[:-1], path_parameters[1:]
+        p0, p1 = positions[:-1], positions[1:]
+
+        accepted_t0, accepted_t1, accepted_lengths = [], [], []
+
+        for depth in range(max_depth + 1):
+            t_mid = (t0 + t1) / 2
+            p_mid = self._poses(t_mid)[:, 0:3, 3]
+
+            chord = np.linalg.norm(p1 - p0, axis=1)
+            left = np.linalg.norm(p_mid - p0, axis=1)
+            right = np.linalg.norm(p1 - p_mid, axis=1)
+            refined = left + right
+
+            # (refined - chord) / 3 estimates the error of the refined length. Errors of the interval lengths add up,
+            # so the tolerance is distributed over the intervals according to their width.
+            length_converged = (refined - chord) / 3 <= tolerance * (t1 - t0)
+            # Linearly interpolating between the knots should put the midpoint at the right arc length
+            midpoint_converged = np.abs(left - refined / 2) <= tolerance
+            done = (length_converged & midpoint_converged) | (depth == max_depth)
+
+            accepted_t0.append(t0[done])
+            accepted_t1.append(t1[done])
+            accepted_lengths.append(refined[done] + (refined[done] - chord[done]) / 3)
+
+            todo = ~done
+            if not np.any(todo):
+                break
+
+            t0, t1 = np.concatenate((t0[todo], t_mid[todo])), np.concatenate((t_mid[todo], t1[todo]))
+            p0, p1 = np.concatenate((p0[todo], p_mid[todo])), np.concatenate((p_mid[todo], p1[todo]))
+
+        t0 = np.concatenate(accepted_t0)
+        order = np.argsort(t0)
+        t1 = np.concatenate(accepted_t1)[order]
+        lengths = np.concatenate(accepted_lengths)[order]
+
+        path_parameters = np.concatenate(([0.0], t1))
+        arc_lengths = np.concatenate(([0.0], np.cumsum(lengths)))
+        return path_parameters, arc_lengths
+
+    def path_length(self, steps=1000, tolerance=None):
+        if tolerance is None:
+            _, arc_lengths = self.arc_length_table(steps)
+        else:
+            _, arc_lengths = self.adaptive_arc_length_table(tolerance)
+        return arc_lengths[-1]
+
+    def init_completion_to_parameter_map(self, steps=1000, tolerance=None):
+        """Build the table that maps path completions (fractions of the arc length) to path parameters.
+
+        Args:
+            steps (int, optional): amount of evenly spaced samples, used when no tolerance is given. Defaults to 1000.
+            tolerance (float, optional): if given, build the table adaptively to this absolute arc length tolerance.
+
+        Returns:
+            InterpolatingDict: the completion to parameter map.
+        """
+        if tolerance is None:
+            path_parameters, arc_lengths = self.arc_length_table(steps)
+        else:
+            path_parameters, arc_lengths = self.adaptive_arc_length_table(tolerance)
+        path_length = arc_lengths[-1]
+
+        if path_length == 0.0:
+            # Degenerate path that stays in one place, fall back to the identity map
+            completions = path_parameters
+        else:
+            # Drop samples that did not move, so every completion maps to a single path parameter
+            moved = np.concatenate(([True], np.diff(arc_lengths) > 0.0))
+            path_parameters = path_parameters[moved]
+            completions = arc_lengths[moved] / path_length
+
+        map = abt.InterpolatingDict.from_arrays(completions, path_parameters)
+        self._completion_to_parameter_map = map
+        self._length = path_length
         return map
 
+    @property
+    def length(self):
+        """Arc length of the path, as measured when the arc-length table was built."""
+        if self._completion_to_parameter_map is None:
+            self.prepare()
+        return self._length
+
 
 class LinearPath(CartesianPath):
     def __init__(self, start_position, end_position, orientation):
@@ -72,6 +215,11 @@ class LinearPath(CartesianPath):
         pose = abt.Frame.from_orientation_and_position(self.orientation, position)
         return pose
 
+    def _poses(self, path_parameters):
+        t = np.asarray(path_parameters, dtype=float)[:, np.newaxis]
+        positions = (1.0 - t) * np.asarray(self.start_position) + t * np.asarray(self.end_position)
+        return abt.FrameArray.from_orientations_and_positions(self.orientation, positions)
+
 
 class TiltedEllipticalArcPath(CartesianPath):
     def __init__(
@@ -94,11 +242,21 @@ class TiltedEllipticalArcPath(CartesianPath):
         self.scale = scale
         self.tilt_angle = tilt_angle
 
-        # Get end pose as if orientation mode was "rotated", only used internally
-        self.orientation_mode = "rotated"
-        self._end_pose = self._pose(1.0)
         self.orientation_mode = orientation_mode
 
+        # Everything below is constant along the path, so it is computed once instead of for every evaluation.
+        self._basis = np.asarray(self._rotation_basis())
+        self._basis_inverse = np.asarray(abt.Frame(self._basis).inverse())
+        self._start_pose_in_basis = self._basis_inverse @ np.asarray(self._start_pose)
+
+        tilt = Rotation.from_rotvec(np.array([0, self.tilt_angle, 0]), degrees=True).as_matrix()
+        self._tilt_matrix_transposed = tilt.T
+
+        # End pose as if orientation mode was "rotated", only used internally
+        self._end_pose = abt.Frame(self._rotated_poses(np.array([1.0]))[0])
+        orientations = Rotation.from_matrix([self._start_pose.orientation, self._end_pose.orientation])
+        self._slerp = Slerp([0.0, 1.0], orientations)
+
         super().__init__()
 
     def _rotation_basis(self):
@@ -113,6 +271,23 @@ class TiltedEllipticalArcPath(CartesianPath):
         Z = np.cross(X, Y)
         return abt.Frame.from_vectors(X, Y, Z, projection)
 
+    def _rotated_poses(self, path_parameters):
+        """Poses along the arc where the orientation rotates along with the position."""
+        angles = np.deg2rad(self.start_angle + path_parameters * (self.end_angle - self.start_angle))
+        cos, sin = np.cos(angles)[:, np.newaxis], np.sin(angles)[:, np.newaxis]
+
+        # Rotate the start pose around the X axis of the basis, written out instead of building rotation matrices
+        Q = self._start_pose_in_basis
+        P = np.empty((len(angles), 4, 4))
+        P[:, 0] = Q[0]
+        P[:, 1] = cos * Q[1] - sin * Q[2]
+        P[:, 2] = sin * Q[1] + cos * Q[2]
+        P[:, 3] = Q[3]
+
+        P[:, 2, 3] *= self.scale
+        P[:, :3, 3] = P[:, :3, 3] @ self._tilt_matrix_transposed  # Only tilt position, not orientation
+        return self._basis @ P
+
     def _pose(self, path_parameter=0.5):
         """Get a pose along the path at a given completion.
 
@@ -122,33 +297,19 @@ class TiltedEllipticalArcPath(CartesianPath):
         Returns:
             np.ndarray: a 4x4 matrix that describes a 3D pose
         """
-        angle = self.start_angle + path_parameter * (self.end_angle - self.start_angle)
-        basis = self._rotation_basis()
+        return abt.Frame(self._poses(np.array([path_parameter], dtype=float))[0])
 
-        rotation_matrix = np.identity(4)
-        rotation_matrix[:3, :3] = Rotation.from_rotvec([angle, 0, 0], degrees=True).as_matrix()
-
-        tilt_matrix = np.identity(4)
-        tilt_matrix[:3, :3] = Rotation.from_rotvec(np.array([0, self.tilt_angle, 0]), degrees=True).as_matrix()
-
-        P = self._start_pose.copy()
-        P = np.linalg.inv(basis) @ P
-        P = rotation_matrix @ P
-        P[2, 3] *= self.scale
-        P[:, 3] = tilt_matrix @ P[:, 3]  # Only tilt position, not orientation
-        P = basis @ P
-        pose = P
+    def _poses(self, path_parameters):
+        t = np.asarray(path_parameters, dtype=float)
+        poses = self._rotated_poses(t)
 
         if self.orientation_mode == "constant":
-            pose[:3, :3] = self._start_pose.orientation
+            poses[:, :3, :3] = self._start_pose.orientation
 
         elif self.orientation_mode == "slerp":
-            orientations = Rotation.from_matrix([self._start_pose.orientation, self._end_pose.orientation])
-            slerp = Slerp([0.0, 1.0], orientations)
-            interpolated_orientation = slerp(path_parameter).as_matrix()
-            pose[:3, :3] = interpolated_orientation
+            poses[:, :3, :3] = self._slerp(t).as_matrix()
 
-        return abt.Frame(pose)
+        return poses
 
 
 class CircularArcPath(TiltedEllipticalArcPath):
@@ -212,20 +373,28 @@ def cubic_bezier_polynomial(control_points, bezier_parameter):
     return P0_term + P1_term + P2_term + P3_term
 
 
-class BezierPath(CartesianPath):
-    def __init__(self, control_points, start_orientation, end_orientation):
-        if len(control_points) != 3 and len(control_points) != 4:
-            raise Exception(
-                """Currently only quadratic and cubic Bezier paths are supported,
-                which require 3 or 4 control points respectively."""
-            )
-
-        if len(control_points) == 3:
-            self.bezier_polynomial = quadratic_bezier_polynomial
-        else:
-            self.bezier_polynomial = cubic_bezier_polynomial
+def bernstein_basis(degree, t):
+    """The Bernstein polynomials C(degree, i) t^i (1 - t)^(degree - i) of a given degree, evaluated at many t at once.
+    They are the probabilities of the binomial distribution, which scipy evaluates stably for high degrees.
 
-        self.control_points = control_points
+    Args:
+        degree (int): degree of the Bernstein polynomials
+        t (np.ndarray): 1D array of parameters in [0, 1]
+
+    Returns:
+        np.ndarray: (len(t), degree + 1) matrix
+    """
+    t = np.asarray(t, dtype=float).reshape(-1, 1)
+    return binom.pmf(np.arange(degree + 1), degree, t)
+
+
+class CurvePath(CartesianPath):
+    """Base class for paths whose position is a differentiable curve and whose orientation is slerped between a start
+    and end orientation. Subclasses implement positions(), velocities() and accelerations(), where the derivatives are
+    taken with respect to the path parameter.
+    """
+
+    def __init__(self, start_orientation, end_orientation):
         self.start_orientation = start_orientation
         self.end_orientation = end_orientation
 
@@ -235,8 +404,204 @@ class BezierPath(CartesianPath):
 
         super().__init__()
 
+    @abstractmethod
+    def positions(self, path_parameters):
+        pass
+
+    @abstractmethod
+    def velocities(self, path_parameters):
+        pass
+
+    @abstractmethod
+    def accelerations(self, path_parameters):
+        pass
+
+    def speeds(self, path_parameters):
+        return np.linalg.norm(self.velocities(np.asarray(path_parameters, dtype=float)), axis=1)
+
+    def tangents(self, path_parameters):
+        velocities = self.velocities(np.asarray(path_parameters, dtype=float))
+        return velocities / np.linalg.norm(velocities, axis=1, keepdims=True)
+
+    def _pose(self, path_parameter=0.5):
+        return abt.Frame(self._poses(np.array([path_parameter], dtype=float))[0])
+
+    def _poses(self, path_parameters):
+        t = np.asarray(path_parameters, dtype=float)
+        return abt.FrameArray.from_orientations_and_positions(self.slerp(t).as_matrix(), self.positions(t))
+
+    def arc_length_table(self, steps=1000, quadrature_points=5):
+        """Integrate the speed of the curve with Gauss-Legendre quadrature on evenly spaced intervals. Unlike summing
+        chord lengths, this does not underestimate the length of curved intervals.
+
+        Args:
+            steps (int, optional): amount of intervals. Defaults to 1000.
+            quadrature_points (int, optional): amount of Gauss-Legendre nodes per interval. Defaults to 5.
+
+        Returns:
+            tuple: two arrays of length steps + 1, the path parameters and the arc length up to each of them.
+        """
+        path_parameters = np.linspace(0, 1, steps + 1)
+        nodes, weights = np.polynomial.legendre.leggauss(quadrature_points)
+        half_width = 0.5 / steps
+        centers = (path_parameters[:-1] + path_parameters[1:]) / 2
+        t = (centers[:, np.newaxis] + half_width * nodes).ravel()
+        speeds = self.speeds(t).reshape(steps, quadrature_points)
+        segment_lengths = half_width * (speeds @ weights)
+        arc_lengths = np.concatenate(([0.0], np.cumsum(segment_lengths)))
+        return path_parameters, arc_lengths
+
+
+class BezierPath(CurvePath):
+    """Bezier curve of arbitrary degree, the degree is the amount of control points minus one. Evaluating it for N
+    parameters multiplies the (N, degree + 1) Bernstein basis with the control points. The derivatives are the lower
+    degree Bezier curves of the hodograph, whose control points are the scaled differences of the control points.
+    """
+
+    def __init__(self, control_points, start_orientation, end_orientation):
+        if len(control_points) < 2:
+            raise Exception("A Bezier path requires at least 2 control points.")
+
+        self.control_points = control_points
+        self.degree = len(control_points) - 1
+
+        n = self.degree
+        self._control_points = np.asarray(control_points, dtype=float)
+        self._velocity_control_points = n * np.diff(self._control_points, n=1, axis=0)
+        self._acceleration_control_points = n * (n - 1) * np.diff(self._control_points, n=2, axis=0)
+
+        super().__init__(start_orientation, end_orientation)
+
+    @staticmethod
+    def _evaluate(control_points, path_parameters):
+        t = np.asarray(path_parameters, dtype=float)
+        if len(control_points) == 0:
+            return np.zeros((len(t), 3))
+        return bernstein_basis(len(control_points) - 1, t) @ control_points
+
+    def positions(self, path_parameters):
+        return self._evaluate(self._control_points, path_parameters)
+
+    def velocities(self, path_parameters):
+        return self._evaluate(self._velocity_control_points, path_parameters)
+
+    def accelerations(self, path_parameters):
+        return self._evaluate(self._acceleration_control_points, path_parameters)
+
+
+class BSplinePath(CurvePath):
+    """Clamped B-spline with uniformly spaced knots, so it starts at the first and ends at the last control point."""
+
+    def __init__(self, control_points, start_orientation, end_orientation, degree=3):
+        if len(control_points) < degree + 1:
+            raise Exception(f"A B-spline path of degree {degree} requires at least {degree + 1} control points.")
+
+        self.control_points = control_points
+        self.degree = degree
+
+        amount_of_spans = len(control_points) - degree
+        knots = np.concatenate((np.zeros(degree), np.linspace(0, 1, amount_of_spans + 1), np.ones(degree)))
+        self._spline = BSpline(knots, np.asarray(control_points, dtype=float), degree)
+        self._spline_velocity = self._spline.derivative(1) if degree >= 1 else None
+        self._spline_acceleration = self._spline.derivative(2) if degree >= 2 else None
+
+        super().__init__(start_orientation, end_orientation)
+
+    def _evaluate(self, spline, path_parameters):
+        t = np.asarray(path_parameters, dtype=float)
+        if spline is None:
+            return np.zeros((len(t), 3))
+        return spline(t)
+
+    def positions(self, path_parameters):
+        return self._evaluate(self._spline, path_parameters)
+
+    def velocities(self, path_parameters):
+        return self._evaluate(self._spline_velocity, path_parameters)
+
+    def accelerations(self, path_parameters):
+        return self._evaluate(self._spline_acceleration, path_parameters)
+
+
+class CompositePath(CartesianPath):
+    """Path that chains any number of paths back to back, e.g. an approach, grasp, lift and place motion.
+
+    The completion of the composite path is distributed over the segments according to their arc length. The segment
+    of each query is found with a binary search in the cumulative segment lengths, and each segment evaluates all of
+    its queries in one poses() call.
+    """
+
+    def __init__(self, segments):
+        if len(segments) == 0:
+            raise Exception("A composite path requires at least 1 segment.")
+
+        self.segments = list(segments)
+        super().__init__()
+
+    def init_completion_to_parameter_map(self, steps=1000, tolerance=None):
+        # The segments are already parametrized by arc length, so only the segment boundaries need to be known.
+        for segment in self.segments:
+            if tolerance is not None:
+                segment.prepare(steps=steps, tolerance=tolerance)
+            elif segment._completion_to_parameter_map is None:
+                segment.prepare(steps=steps)
+
+        segment_lengths = np.array([segment.length for segment in self.segments])
+        self._segment_lengths = segment_lengths
+        self._segment_starts = np.concatenate(([0.0], np.cumsum(segment_lengths)[:-1]))
+        self._length = float(np.sum(segment_lengths))
+
+        map = abt.InterpolatingDict.from_arrays([0.0, 1.0], [0.0, 1.0])
+        self._completion_to_parameter_map = map
+        return map
+
+    def path_length(self, steps=1000, tolerance=None):
+        return float(sum(segment.path_length(steps, tolerance) for segment in self.segments))
+
+    def segment_index(self, path_completions):
+        """Index of the segment each path completion falls in, and the completion within that segment.
+
+        Args:
+            path_completions (np.ndarray): 1D array of path completions between 0 and 1
+
+        Returns:
+            tuple: array of segment indices and array of segment completions
+        """
+        if self._completion_to_parameter_map is None:
+            self.prepare()
+
+        arc_lengths = np.clip(np.asarray(path_completions, dtype=float), 0.0, 1.0) * self._length
+        indices = np.searchsorted(self._segment_starts, arc_lengths, side="right") - 1
+        indices = np.clip(indices, 0, len(self.segments) - 1)
+
+        segment_lengths = self._segment_lengths[indices]
+        distances = arc_lengths - self._segment_starts[indices]
+        safe_lengths = np.where(segment_lengths > 0.0, segment_lengths, 1.0)
+        segment_completions = np.where(segment_lengths > 0.0, np.clip(distances / safe_lengths, 0.0, 1.0), 0.0)
+        return indices, segment_completions
+
+    @property
+    def start(self):
+        return self.segments[0].start
+
+    @property
+    def end(self):
+        return self.segments[-1].end
+
     def _pose(self, path_parameter=0.5):
-        position = self.bezier_polynomial(self.control_points, path_parameter)
-        interpolated_orientation = self.slerp(path_parameter).as_matrix()
-        pose = abt.Frame.from_orientation_and_position(interpolated_orientation, position)
-        return pose
+        return abt.Frame(self._poses(np.array([path_parameter], dtype=float))[0])
+
+    def _poses(self, path_parameters):
+        indices, segment_completions = self.segment_index(path_parameters)
+        poses = np.empty((len(indices), 4, 4))
+
+        # Group the queries per segment once, so each segment gets a slice instead of a mask over all queries
+        order = np.argsort(indices, kind="stable")
+        sorted_indices = indices[order]
+        segments = np.unique(sorted_indices)
+        starts = np.searchsorted(sorted_indices, segments, side="left")
+        ends = np.searchsorted(sorted_indices, segments, side="right")
+        for index, start, end in zip(segments.tolist(), starts.tolist(), ends.tolist()):
+            queries = order[start:end]
+            poses[queries] = self.segments[index].poses(segment_completions[queries])
+        return poses
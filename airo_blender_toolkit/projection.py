@@ -0,0 +1,159 @@
+import bpy
+import numpy as np
+
+
+def image_resolution(scene=None):
+    """The width and height in pixels of the images rendered for a scene, taking the resolution percentage into
+    account."""
+    scene = bpy.context.scene if scene is None else scene
+    render = scene.render
+    scale = render.resolution_percentage / 100.0
+    return int(render.resolution_x * scale), int(render.resolution_y * scale)
+
+
+def _intrinsics_matrix(
+    focal_length,
+    sensor_width,
+    sensor_height,
+    sensor_fit,
+    shift_x,
+    shift_y,
+    resolution_x,
+    resolution_y,
+    pixel_aspect_x=1.0,
+    pixel_aspect_y=1.0,
+):
+    """The 3x3 camera matrix from Blender's camera settings, with the principal point in pixels measured from the top
+    left corner of the image. For orthographic cameras, pass a focal length of 1 and the orthographic scale as sensor
+    size.
+    """
+    if sensor_fit == "AUTO":
+        fits_horizontal = resolution_x * pixel_aspect_x >= resolution_y * pixel_aspect_y
+        sensor_size = sensor_width
+    else:
+        fits_horizontal = sensor_fit == "HORIZONTAL"
+        sensor_size = sensor_width if fits_horizontal else sensor_height
+
+    pixel_aspect_ratio = pixel_aspect_y / pixel_aspect_x
+    view_size = resolution_x if fits_horizontal else pixel_aspect_ratio * resolution_y
+    pixels_per_unit = focal_length * view_size / sensor_size
+
+    return np.array(
+        [
+            [pixels_per_unit, 0.0, resolution_x / 2.0 - shift_x * view_size],
+            [0.0, pixels_per_unit / pixel_aspect_ratio, resolution_y / 2.0 + shift_y * view_size / pixel_aspect_ratio],
+            [0.0, 0.0, 1.0],
+        ]
+    )
+
+
+def intrinsics_matrix(camera_obj=None, scene=None) -> np.ndarray:
+    """The 3x3 camera matrix of a camera, including its sensor fit and shift and the pixel aspect ratio of the scene.
+
+    Args:
+        camera_obj (bpy.types.Object, optional): the camera. Defaults to the scene camera.
+        scene (bpy.types.Scene, optional): the scene, which determines the image resolution. Defaults to the active
+                                           scene.
+
+    Returns:
+        np.ndarray: (3, 3) array with the focal lengths in pixels on the diagonal and the principal point, in pixels
+                    from the top left corner of the image, in the last column.
+    """
+    scene = bpy.context.scene if scene is None else scene
+    camera_obj = scene.camera if camera_obj is None else camera_obj
+    camera = camera_obj.data
+    resolution_x, resolution_y = image_resolution(scene)
+
+    if camera.type == "ORTHO":
+        # The orthographic scale is the size of the view, so it takes the place of the sensor size over focal length
+        focal_length, sensor_width, sensor_height = 1.0, camera.ortho_scale, camera.ortho_scale
+    else:
+        focal_length, sensor_width, sensor_height = camera.lens, camera.sensor_width, camera.sensor_height
+
+    return _intrinsics_matrix(
+        focal_length,
+        sensor_width,
+        sensor_height,
+        camera.sensor_fit,
+        camera.shift_x,
+        camera.shift_y,
+        resolution_x,
+        resolution_y,
+        scene.render.pixel_aspect_x,
+        scene.render.pixel_aspect_y,
+    )
+
+
+def _view_projection_matrix(intrinsics, world_to_camera, is_ortho=False):
+    # Blender cameras look along their -Z axis with Y up, image rows go down, so flip the Y and Z axes
+    camera_to_image = np.diag([1.0, -1.0, -1.0, 1.0])
+    projection = np.identity(4)
+    projection[:2, :3] = intrinsics[:2, :3]
+    if is_ortho:
+        projection[:2, 2] = 0.0
+        projection[:2, 3] = intrinsics[:2, 2]
+    else:
+        projection[3] = (0.0, 0.0, 1.0, 0.0)
+    return projection @ camera_to_image @ world_to_camera
+
+
+def view_projection_matrix(camera_obj=None, scene=None) -> np.ndarray:
+    """The 4x4 matrix that maps homogeneous world space coordinates to (u * w, v * w, depth, w), with u and v the
+    pixel coordinates and w the depth for perspective cameras or 1 for orthographic cameras.
+
+    Args:
+        camera_obj (bpy.types.Object, optional): the camera. Defaults to the scene camera.
+        scene (bpy.types.Scene, optional): Defaults to the active scene.
+
+    Returns:
+        np.ndarray: (4, 4) array.
+    """
+    scene = bpy.context.scene if scene is None else scene
+    camera_obj = scene.camera if camera_obj is None else camera_obj
+    world_to_camera = np.linalg.inv(np.array(camera_obj.matrix_world))
+    intrinsics = intrinsics_matrix(camera_obj, scene)
+    return _view_projection_matrix(intrinsics, world_to_camera, camera_obj.data.type == "ORTHO")
+
+
+def _project(points, view_projection):
+    """Pixel coordinates and depths of an (N, 3) array of points, see project_points()."""
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    projected = points @ view_projection[:, :3].T + view_projection[:, 3]
+    w = projected[:, 3:4]
+    pixels = projected[:, :2] / np.where(w != 0.0, w, np.finfo(float).eps)
+    return pixels, projected[:, 2]
+
+
+def project_points(points: np.ndarray, camera_obj=None, scene=None):
+    """Projects world space points to pixel coordinates in the image of a camera.
+
+    Pixel coordinates are measured from the top left corner of the image, so the center of the top left pixel is at
+    (0.5, 0.5), like COCO keypoints. Points with a depth of zero or less are behind the camera and their pixel
+    coordinates are meaningless.
+
+    Args:
+        points (np.ndarray): (N, 3) array of world space coordinates.
+        camera_obj (bpy.types.Object, optional): the camera. Defaults to the scene camera.
+        scene (bpy.types.Scene, optional): Defaults to the active scene.
+
+    Returns:
+        tuple: (N, 2) array with the u and v pixel coordinates and (N,) array with the depths along the viewing
+               direction of the camera.
+    """
+    return _project(points, view_projection_matrix(camera_obj, scene))
+
+
+def in_image_mask(pixels: np.ndarray, depths: np.ndarray, scene=None) -> np.ndarray:
+    """Checks which projected points lie in front of the camera and inside the image.
+
+    Args:
+        pixels (np.ndarray): (N, 2) array of pixel coordinates, as returned by project_points().
+        depths (np.ndarray): (N,) array of depths, as returned by project_points().
+        scene (bpy.types.Scene, optional): the scene, which determines the image resolution. Defaults to the active
+                                           scene.
+
+    Returns:
+        np.ndarray: (N,) boolean mask.
+    """
+    resolution = np.array(image_resolution(scene))
+    return (depths > 0.0) & np.all((pixels >= 0.0) & (pixels <= resolution), axis=1)
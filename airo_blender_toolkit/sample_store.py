@@ -0,0 +1,374 @@
+"""Binary store for keypoint samples that training loaders can memory-map without parsing.
+
+A store is a directory with one raw binary file per column, in which row i is sample i, and a metadata.json file with
+the amount of samples and images, the dtype and shape of each column and the COCO categories.
+
+The images are a separate table, so images without samples are kept too. Their ids and sizes are columns with one row
+per image and their paths are stored as UTF-8 bytes in image_paths.bin, with the end offset of each path in
+image_path_ends.bin. The index of the images lists the samples of each image: image_samples.bin holds the sample
+indices grouped per image, with the end offset of the group of each image in image_sample_ends.bin. The COCO
+segmentations of the samples are stored as UTF-8 JSON in the same way, in segmentations.bin and segmentation_ends.bin.
+"""
+import json
+import os
+from typing import List
+
+import numpy as np
+
+from airo_blender_toolkit.coco_loader import CocoKeypointsArrays
+
+_format_version = 2
+
+
+def _columns(amount_of_keypoints):
+    return {
+        "keypoints": (np.float32, (amount_of_keypoints, 2)),
+        "visibility": (np.uint8, (amount_of_keypoints,)),
+        "intrinsics": (np.float32, (3, 3)),
+        "extrinsics": (np.float32, (4, 4)),
+        "image_id": (np.int64, ()),
+        "annotation_id": (np.int64, ()),
+        "category_id": (np.int64, ()),
+        "bbox": (np.float32, (4,)),
+        "area": (np.float32, ()),
+        "iscrowd": (np.uint8, ()),
+    }
+
+
+_image_columns = {
+    "image_ids": (np.int64, ()),
+    "image_sizes": (np.int32, (2,)),
+}
+
+_offset_files = ("image_paths", "image_path_ends", "segmentations", "segmentation_ends")
+
+
+class SampleStoreWriter:
+    """Appends samples to a sample store. Samples are appended to the column files as they come in, so memory use
+    stays constant apart from a dictionary with the ids of the images. The index of the images is built when the
+    writer is closed.
+
+    Example:
+        with abt.SampleStoreWriter("dataset/store", amount_of_keypoints=4, categories=[towel.dict()]) as writer:
+            writer.append(keypoints, visibility, "images/0.png", image_id=0, image_size=(640, 480))
+    """
+
+    def __init__(self, directory: str, amount_of_keypoints: int, categories: List[dict] = None):
+        """
+        Args:
+            directory (str): the directory of the store, it is created if needed. An existing store is overwritten.
+            amount_of_keypoints (int): the amount of keypoints of every sample.
+            categories (List[dict], optional): the COCO categories of the samples.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.columns = _columns(amount_of_keypoints)
+        self.categories = [] if categories is None else categories
+        self.amount_of_keypoints = amount_of_keypoints
+        self.count = 0
+        self._image_rows = {}  # image id -> row in the images table
+        self._next_image_id = 0
+        self._ends = {"image_path_ends": 0, "segmentation_ends": 0}
+
+        names = [*self.columns, *_image_columns, *_offset_files]
+        self._files = {name: open(os.path.join(directory, f"{name}.bin"), "wb") for name in names}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_bytes(self, name, ends_name, data: bytes):
+        self._files[name].write(data)
+        self._ends[ends_name] += len(data)
+        self._files[ends_name].write(np.int64(self._ends[ends_name]).tobytes())
+
+    def add_image(self, image_path: str, image_id: int = None, image_size=(0, 0)) -> int:
+        """Add an image to the images table, e.g. an image without samples. Images are also added by append().
+
+        Args:
+            image_path (str): path of the image.
+            image_id (int, optional): id of the image. Defaults to one more than the largest id so far.
+            image_size (tuple, optional): width and height of the image.
+
+        Returns:
+            int: the id of the image. If an image with this id was already added, it is kept as it is.
+        """
+        image_id = self._next_image_id if image_id is None else int(image_id)
+        if image_id in self._image_rows:
+            return image_id
+
+        self._image_rows[image_id] = len(self._image_rows)
+        self._next_image_id = max(self._next_image_id, image_id + 1)
+        self._files["image_ids"].write(np.int64(image_id).tobytes())
+        self._files["image_sizes"].write(np.asarray(image_size, dtype=np.int32).reshape(2).tobytes())
+        self._write_bytes("image_paths", "image_path_ends", image_path.encode("utf-8"))
+        return image_id
+
+    def append(
+        self,
+        keypoints: np.ndarray,
+        visibility: np.ndarray,
+        image_path: str,
+        intrinsics: np.ndarray = None,
+        extrinsics: np.ndarray = None,
+        image_id: int = None,
+        image_size=(0, 0),
+        category_id: int = 1,
+        bbox=(0.0, 0.0, 0.0, 0.0),
+        area: float = 0.0,
+        annotation_id: int = None,
+        iscrowd: int = 0,
+        segmentation=None,
+    ):
+        """Write one sample.
+
+        Args:
+            keypoints (np.ndarray): (K, 2) pixel coordinates of the keypoints.
+            visibility (np.ndarray): (K,) COCO visibility flags of the keypoints.
+            image_path (str): path of the image of the sample.
+            intrinsics (np.ndarray, optional): (3, 3) camera matrix, e.g. abt.intrinsics_matrix(). Defaults to NaN.
+            extrinsics (np.ndarray, optional): (4, 4) pose of the camera in the world. Defaults to NaN.
+            image_id (int, optional): id of the image, see add_image(). The path and size of an image that was added
+                                      before are not changed. Defaults to a new image.
+            image_size (tuple, optional): width and height of the image.
+            category_id (int, optional): COCO category of the sample. Defaults to 1.
+            bbox (tuple, optional): COCO bounding box [x, y, width, height].
+            area (float, optional): COCO area.
+            annotation_id (int, optional): COCO annotation id. Defaults to the index of the sample plus one.
+            iscrowd (int, optional): COCO crowd flag. Defaults to 0.
+            segmentation (optional): COCO segmentation, polygons or RLE. Defaults to [].
+        """
+        image_id = self.add_image(image_path, image_id, image_size)
+        values = {
+            "keypoints": keypoints,
+            "visibility": visibility,
+            "intrinsics": np.full((3, 3), np.nan) if intrinsics is None else intrinsics,
+            "extrinsics": np.full((4, 4), np.nan) if extrinsics is None else extrinsics,
+            "image_id": image_id,
+            "annotation_id": self.count + 1 if annotation_id is None else annotation_id,
+            "category_id": category_id,
+            "bbox": bbox,
+            "area": area,
+            "iscrowd": iscrowd,
+        }
+        for name, (dtype, shape) in self.columns.items():
+            value = np.asarray(values[name], dtype=dtype)
+            assert value.shape == shape, f"{name} should have shape {shape}, not {value.shape}."
+            self._files[name].write(value.tobytes())
+
+        segmentation = [] if segmentation is None else segmentation
+        self._write_bytes("segmentations", "segmentation_ends", json.dumps(segmentation).encode("utf-8"))
+        self.count += 1
+
+    def _write_image_index(self):
+        """Groups the sample indices per image, in the order of the images table and then of the samples."""
+        # The rows of the images table are in the order in which the images were added
+        table_ids = np.fromiter(self._image_rows, dtype=np.int64, count=len(self._image_rows))
+        id_order = np.argsort(table_ids)
+        sample_image_ids = np.fromfile(os.path.join(self.directory, "image_id.bin"), dtype=np.int64)
+        sample_rows = id_order[np.searchsorted(table_ids[id_order], sample_image_ids)]
+
+        image_samples = np.argsort(sample_rows, kind="stable").astype(np.int64)
+        image_sample_ends = np.cumsum(np.bincount(sample_rows, minlength=len(self._image_rows))).astype(np.int64)
+        image_samples.tofile(os.path.join(self.directory, "image_samples.bin"))
+        image_sample_ends.tofile(os.path.join(self.directory, "image_sample_ends.bin"))
+
+    def close(self):
+        """Close the column files, build the index of the images and write the metadata, which makes the store
+        readable."""
+        for file in self._files.values():
+            file.close()
+        self._write_image_index()
+
+        columns = {
+            name: {"dtype": np.dtype(dtype).str, "shape": list(shape)} for name, (dtype, shape) in self.columns.items()
+        }
+        metadata = {
+            "version": _format_version,
+            "count": self.count,
+            "amount_of_images": len(self._image_rows),
+            "columns": columns,
+            "categories": self.categories,
+        }
+        with open(os.path.join(self.directory, "metadata.json"), "w") as file:
+            json.dump(metadata, file)
+
+
+class SampleStore:
+    """Read-only, memory-mapped view of a sample store. The columns are attributes with the samples as rows, e.g.
+    store.keypoints is an (N, K, 2) array, so only the rows that are accessed are read from disk. The images table is
+    available as store.image_ids (M,) and store.image_sizes (M, 2)."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "metadata.json")) as file:
+            metadata = json.load(file)
+
+        self.count = metadata["count"]
+        self.amount_of_images = metadata["amount_of_images"]
+        self.categories = metadata["categories"]
+        self.column_names = list(metadata["columns"])
+        for name, column in metadata["columns"].items():
+            shape = (self.count, *column["shape"])
+            setattr(self, name, self._memmap(f"{name}.bin", np.dtype(column["dtype"]), shape))
+        for name, (dtype, shape) in _image_columns.items():
+            setattr(self, name, self._memmap(f"{name}.bin", np.dtype(dtype), (self.amount_of_images, *shape)))
+
+        self._image_path_ends = self._memmap("image_path_ends.bin", np.dtype(np.int64), (self.amount_of_images,))
+        self._image_paths = self._memmap_bytes("image_paths.bin", self._image_path_ends)
+        self._segmentation_ends = self._memmap("segmentation_ends.bin", np.dtype(np.int64), (self.count,))
+        self._segmentations = self._memmap_bytes("segmentations.bin", self._segmentation_ends)
+        self._image_samples = self._memmap("image_samples.bin", np.dtype(np.int64), (self.count,))
+        self._image_sample_ends = self._memmap("image_sample_ends.bin", np.dtype(np.int64), (self.amount_of_images,))
+        self._image_id_order = None
+
+    def _memmap(self, file_name, dtype, shape):
+        if np.prod(shape) == 0:  # empty files cannot be memory-mapped
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.directory, file_name), dtype=dtype, mode="r", shape=shape)
+
+    def _memmap_bytes(self, file_name, ends):
+        amount_of_bytes = int(ends[-1]) if len(ends) > 0 else 0
+        return self._memmap(file_name, np.dtype(np.uint8), (amount_of_bytes,))
+
+    @staticmethod
+    def _slice(ends, index):
+        start = int(ends[index - 1]) if index > 0 else 0
+        return start, int(ends[index])
+
+    def __len__(self):
+        return self.count
+
+    def image_row(self, image_id: int) -> int:
+        """Row of an image in the images table, found with a binary search over the sorted image ids."""
+        if self._image_id_order is None:
+            order = np.argsort(self.image_ids, kind="stable")
+            self._image_id_order = order, np.asarray(self.image_ids)[order]
+        order, sorted_ids = self._image_id_order
+        position = int(np.searchsorted(sorted_ids, image_id))
+        if position == len(sorted_ids) or sorted_ids[position] != image_id:
+            raise KeyError(image_id)
+        return int(order[position])
+
+    def samples_of_image(self, image_id: int) -> np.ndarray:
+        """Indices of the samples of an image, in the order in which they were written."""
+        start, end = self._slice(self._image_sample_ends, self.image_row(image_id))
+        return np.asarray(self._image_samples[start:end])
+
+    def image_file_name(self, row: int) -> str:
+        """Path of the image in a row of the images table."""
+        start, end = self._slice(self._image_path_ends, row)
+        return self._image_paths[start:end].tobytes().decode("utf-8")
+
+    def image_path(self, index: int) -> str:
+        """Path of the image of a sample."""
+        return self.image_file_name(self.image_row(int(self.image_id[index])))
+
+    def segmentation(self, index: int):
+        """COCO segmentation of a sample."""
+        start, end = self._slice(self._segmentation_ends, index)
+        return json.loads(self._segmentations[start:end].tobytes().decode("utf-8"))
+
+    def __getitem__(self, index: int) -> dict:
+        sample = {name: getattr(self, name)[index] for name in self.column_names}
+        image_row = self.image_row(int(self.image_id[index]))
+        sample["image_path"] = self.image_file_name(image_row)
+        sample["image_size"] = self.image_sizes[image_row]
+        sample["segmentation"] = self.segmentation(index)
+        return sample
+
+
+def sample_store_from_coco(coco, directory: str) -> SampleStore:
+    """Convert a COCO keypoints dataset to a sample store. COCO has no camera parameters, so those are NaN.
+
+    The images, including those without annotations, and the annotation ids, crowd flags and segmentations are kept,
+    so sample_store_to_coco() gives back the same dataset, apart from the fields listed there.
+
+    Args:
+        coco: path of a COCO keypoints JSON file, or a CocoKeypointsArrays. A CocoKeypointsArrays has no
+              segmentations, so they are stored as [].
+        directory (str): the directory of the new store.
+
+    Returns:
+        SampleStore: the new store.
+    """
+    if isinstance(coco, CocoKeypointsArrays):
+        dataset, segmentations = coco, None
+    else:
+        with open(coco) as file:
+            data = json.load(file)
+        dataset = CocoKeypointsArrays.from_dict(data)
+        segmentations = [annotation.get("segmentation", []) for annotation in data["annotations"]]
+
+    image_rows = {image_id: row for row, image_id in enumerate(dataset.image_ids.tolist())}
+    with SampleStoreWriter(directory, dataset.keypoints.shape[1], dataset.categories) as writer:
+        for row, image_id in enumerate(dataset.image_ids.tolist()):
+            writer.add_image(str(dataset.image_file_names[row]), image_id, dataset.image_sizes[row])
+
+        for i in range(len(dataset)):
+            image_row = image_rows[int(dataset.image_id[i])]
+            writer.append(
+                dataset.keypoints[i, :, :2],
+                dataset.keypoints[i, :, 2],
+                str(dataset.image_file_names[image_row]),
+                image_id=dataset.image_id[i],
+                category_id=dataset.category_id[i],
+                bbox=dataset.bbox[i],
+                area=dataset.area[i],
+                annotation_id=dataset.annotation_ids[i],
+                iscrowd=dataset.iscrowd[i],
+                segmentation=None if segmentations is None else segmentations[i],
+            )
+    return SampleStore(directory)
+
+
+def sample_store_to_coco(store, output_path: str):
+    """Convert a sample store to a COCO keypoints JSON file, with one annotation per sample.
+
+    Not everything survives a round trip through a store: the keypoints, bounding boxes and areas are stored as
+    float32, num_keypoints is recomputed from the visibility flags, and image fields other than the id, file name and
+    size (e.g. license) are not stored. Annotations with fewer keypoints than the store are cut back to the amount of
+    keypoints of their category.
+
+    Args:
+        store: a SampleStore or the directory of one.
+        output_path (str): path of the COCO JSON file to write.
+    """
+    store = store if isinstance(store, SampleStore) else SampleStore(store)
+
+    images = []
+    for row in range(store.amount_of_images):
+        width, height = store.image_sizes[row].tolist()
+        image_id = int(store.image_ids[row])
+        images.append({"id": image_id, "file_name": store.image_file_name(row), "width": width, "height": height})
+
+    amounts_of_keypoints = {
+        category["id"]: len(category["keypoints"]) for category in store.categories if "keypoints" in category
+    }
+    annotations = []
+    for i in range(len(store)):
+        category_id = int(store.category_id[i])
+        amount_of_keypoints = amounts_of_keypoints.get(category_id, store.keypoints.shape[1])
+        visibility = store.visibility[i, :amount_of_keypoints]
+        keypoints = []
+        for (x, y), flag in zip(store.keypoints[i, :amount_of_keypoints].tolist(), visibility.tolist()):
+            keypoints += [x, y, flag]
+        annotations.append(
+            {
+                "id": int(store.annotation_id[i]),
+                "image_id": int(store.image_id[i]),
+                "category_id": category_id,
+                "segmentation": store.segmentation(i),
+                "area": float(store.area[i]),
+                "bbox": store.bbox[i].tolist(),
+                "iscrowd": int(store.iscrowd[i]),
+                "num_keypoints": int(np.count_nonzero(visibility)),
+                "keypoints": keypoints,
+            }
+        )
+
+    coco = {"categories": store.categories, "images": images, "annotations": annotations}
+    with open(output_path, "w") as file:
+        json.dump(coco, file)
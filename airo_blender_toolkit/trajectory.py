@@ -1,3 +1,5 @@
+import numpy as np
+
 from airo_blender_toolkit.time_parametrization import Linear
 
 
@@ -17,3 +19,7 @@ class Trajectory:
     def pose(self, time_completion):
         path_completion = self.time_parametrization.map(time_completion)
         return self.path.pose(path_completion)
+
+    def poses(self, time_completions):
+        path_completions = self.time_parametrization.map(np.asarray(time_completions, dtype=float))
+        return self.path.poses(path_completions)
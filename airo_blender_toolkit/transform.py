@@ -2,6 +2,7 @@ import os
 
 import numpy as np
 from mathutils import Matrix, Vector
+from scipy.spatial.transform import Rotation
 
 os.environ["INSIDE_OF_THE_INTERNAL_BLENDER_PYTHON_ENVIRONMENT"] = "1"
 
@@ -47,6 +48,112 @@ class Frame(np.ndarray):
     def orientation(self):
         return self[0:3, 0:3]
 
+    def inverse(self):
+        """Inverse of the frame, computed in closed form as it is a rigid transform: [R^T, -R^T t]."""
+        orientation_inverse = np.asarray(self.orientation).T
+        position_inverse = -orientation_inverse @ np.asarray(self.position)
+        return Frame.from_orientation_and_position(orientation_inverse, position_inverse)
+
+
+class FrameArray(np.ndarray):
+    """Array of N frames stored contiguously as an (N, 4, 4) array, the batched counterpart of Frame.
+    Indexing a single frame with an integer returns a Frame, other indexing that does not yield whole frames returns
+    a plain ndarray.
+    """
+
+    def __new__(cls, matrices):
+        obj = np.asarray(matrices, dtype=float).view(cls)
+        if obj.ndim != 3 or obj.shape[1:] != (4, 4):
+            raise ValueError(f"A FrameArray must have shape (N, 4, 4), got {obj.shape}.")
+        return obj
+
+    def __array_finalize__(self, obj):
+        if obj is None:
+            return
+
+    def __getitem__(self, key):
+        item = super().__getitem__(key)
+        if not isinstance(item, np.ndarray):
+            return item
+        if isinstance(key, (int, np.integer)):
+            return item.view(Frame)
+        if item.ndim != 3 or item.shape[1:] != (4, 4):
+            return item.view(np.ndarray)
+        return item
+
+    @classmethod
+    def from_orientations_and_positions(cls, orientations, positions):
+        """Create frames from a single 3x3 orientation or (N, 3, 3) orientations, and (N, 3) positions."""
+        positions = np.asarray(positions, dtype=float)
+        matrices = np.zeros((len(positions), 4, 4))
+        matrices[:, 0:3, 0:3] = orientations
+        matrices[:, 0:3, 3] = positions
+        matrices[:, 3, 3] = 1.0
+        return cls(matrices)
+
+    @classmethod
+    def from_rotation(cls, rotation: Rotation, positions):
+        """Create frames from a scipy Rotation that holds N rotations and (N, 3) positions."""
+        return cls.from_orientations_and_positions(rotation.as_matrix(), positions)
+
+    @classmethod
+    def from_quaternions(cls, quaternions, positions):
+        """Create frames from (N, 4) quaternions in scalar-last (x, y, z, w) order and (N, 3) positions."""
+        return cls.from_rotation(Rotation.from_quat(quaternions), positions)
+
+    @classmethod
+    def from_frames(cls, frames):
+        return cls(np.stack([np.asarray(frame) for frame in frames]))
+
+    @classmethod
+    def identity(cls, n):
+        return cls(np.tile(np.identity(4), (n, 1, 1)))
+
+    @property
+    def positions(self):
+        return self.view(np.ndarray)[:, 0:3, 3]
+
+    @property
+    def orientations(self):
+        return self.view(np.ndarray)[:, 0:3, 0:3]
+
+    def as_rotation(self) -> Rotation:
+        return Rotation.from_matrix(self.orientations)
+
+    def as_quaternions(self):
+        """Orientations as (N, 4) quaternions in scalar-last (x, y, z, w) order."""
+        return self.as_rotation().as_quat()
+
+    def as_euler(self, seq="xyz"):
+        """Orientations as (N, 3) euler angles in radians. The default "xyz" matches Blender's XYZ rotation mode."""
+        return self.as_rotation().as_euler(seq)
+
+    def compose(self, other):
+        """Frame-wise matrix product self @ other, other can be a single frame or a FrameArray of equal length."""
+        return FrameArray(self.view(np.ndarray) @ np.asarray(other))
+
+    def inverse(self):
+        """Inverses of the frames, computed in closed form as they are rigid transforms: [R^T, -R^T t]."""
+        orientations_inverse = np.swapaxes(self.orientations, 1, 2)
+        positions_inverse = -np.einsum("nij,nj->ni", orientations_inverse, self.positions)
+        return FrameArray.from_orientations_and_positions(orientations_inverse, positions_inverse)
+
+    def as_blender_matrices(self):
+        """Flat float32 buffer of the matrices in Blender's column-major order, e.g. for matrix_world foreach_set."""
+        return np.ascontiguousarray(np.swapaxes(self.view(np.ndarray), 1, 2), dtype=np.float32).ravel()
+
+    def as_blender_locations_and_eulers(self):
+        """Flat float32 buffers of the locations and XYZ euler rotations, e.g. for foreach_set on fcurve data."""
+        locations = np.ascontiguousarray(self.positions, dtype=np.float32).ravel()
+        eulers = np.ascontiguousarray(self.as_euler("xyz"), dtype=np.float32).ravel()
+        return locations, eulers
+
+    @classmethod
+    def from_blender_matrices(cls, buffer):
+        """Inverse of as_blender_matrices(), e.g. for buffers filled with foreach_get("matrix_world")."""
+        matrices = np.asarray(buffer, dtype=float).reshape(-1, 4, 4)
+        return cls(np.swapaxes(matrices, 1, 2))
+
 
 def _rotate_point(point: Vector, rotation_matrix: Matrix, origin: Vector) -> Vector:
     return rotation_matrix @ (point - origin) + origin
@@ -250,7 +357,7 @@ def visualize_path(path, radius=0.002, color=[0.0, 1.0, 0.0, 1.0]):
 
     import airo_blender_toolkit as abt
 
-    vertices = [path.pose(i).position for i in np.linspace(0, 1, 50)]
+    vertices = path.poses(np.linspace(0, 1, 50))[:, 0:3, 3]
     edges = [(i, i + 1) for i in range(len(vertices) - 1)]
     faces = []
     mesh = bpy.data.meshes.new("Path")
@@ -1,110 +1,635 @@
 # Adapted from https://github.com/varkenvarken/blenderaddons/blob/master/visiblevertices.py
 # TODO copy license and give appropriate credit
 
+import warnings
+from typing import List
+
 import bpy
+import numpy as np
 from mathutils import Vector
-from mathutils.geometry import intersect_ray_tri
+from mathutils.bvhtree import BVHTree
+
+from airo_blender_toolkit.projection import _project, image_resolution, view_projection_matrix
+
+
+def is_visible(co: Vector):
+    """Checks if a vertex is visible from the scene camera. Use are_visible() to check many points at once.
+
+    Args:
+        co (Vector): the world space x, y and z coordinates of the vertex.
+
+    Returns:
+        boolean: visibility
+    """
+    return bool(are_visible(np.array([tuple(co)]))[0])
+
+
+def _local_vertex_coordinates(obj):
+    """Object space coordinates of the vertices of a mesh object as an (N, 3) array, read with foreach_get."""
+    mesh = obj.data
+    co = np.empty(3 * len(mesh.vertices), dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    return co.reshape(-1, 3)
+
+
+def _vertex_coordinates(obj):
+    """World space coordinates of the vertices of a mesh object as an (N, 3) array, read with foreach_get."""
+    matrix = np.array(obj.matrix_world)
+    return _local_vertex_coordinates(obj) @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def _camera_view(camera_obj, scene):
+    """View projection matrix of a camera and the resolution of its images, see view_projection_matrix()."""
+    return view_projection_matrix(camera_obj, scene), np.array(image_resolution(scene), dtype=float)
+
+
+def _view_coordinates(points, camera_view):
+    """Coordinates of points in the image of a camera, (0, 0) at its bottom left and (1, 1) at its top right corner,
+    and their depths along the viewing direction of the camera."""
+    view_projection, resolution = camera_view
+    pixels, depths = _project(points, view_projection)
+    view_xy = pixels / resolution
+    view_xy[:, 1] = 1.0 - view_xy[:, 1]  # pixel rows go down
+    return view_xy, depths
+
+
+def frustum_mask(points: np.ndarray, camera_obj=None, scene=None) -> np.ndarray:
+    """Checks which points lie inside the view frustum of a camera, i.e. in front of it and within its image.
+
+    Args:
+        points (np.ndarray): (N, 3) array of world space coordinates.
+        camera_obj (bpy.types.Object, optional): the camera. Defaults to the scene camera.
+        scene (bpy.types.Scene, optional): the scene, which determines the aspect ratio. Defaults to the active scene.
+
+    Returns:
+        np.ndarray: (N,) boolean mask.
+    """
+    scene = bpy.context.scene if scene is None else scene
+    camera_obj = scene.camera if camera_obj is None else camera_obj
+    view_xy, depths = _view_coordinates(points, _camera_view(camera_obj, scene))
+    return (depths > 0.0) & np.all((view_xy >= 0.0) & (view_xy <= 1.0), axis=1)
+
+
+def project_to_cameras(points: np.ndarray, cameras, scene=None) -> np.ndarray:
+    """Projects points into the views of several cameras, like world_to_camera_view() from bpy_extras does for one.
+
+    Args:
+        points (np.ndarray): (N, 3) array of world space coordinates.
+        cameras (list): the camera objects.
+        scene (bpy.types.Scene, optional): the scene, which determines the aspect ratio. Defaults to the active scene.
+
+    Returns:
+        np.ndarray: (n_cameras, N, 3) array, per point the x and y coordinates in the image of the camera, (0, 0) at
+                    its bottom left and (1, 1) at its top right corner, and the depth along its viewing direction.
+    """
+    scene = bpy.context.scene if scene is None else scene
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    projections = np.empty((len(cameras), len(points), 3))
+    for i, camera_obj in enumerate(cameras):
+        view_xy, depths = _view_coordinates(points, _camera_view(camera_obj, scene))
+        projections[i, :, :2] = view_xy
+        projections[i, :, 2] = depths
+    return projections
+
+
+def scene_bvh(depsgraph=None) -> BVHTree:
+    """Build a BVH tree of the world space triangles of all evaluated, visible geometry in the scene.
+
+    Args:
+        depsgraph (bpy.types.Depsgraph, optional): Defaults to the evaluated depsgraph of the current context.
+
+    Returns:
+        BVHTree: the BVH tree.
+    """
+    depsgraph = bpy.context.evaluated_depsgraph_get() if depsgraph is None else depsgraph
+
+    all_vertices, all_triangles = [], []
+    amount_of_vertices = 0
+    for instance in depsgraph.object_instances:
+        vertices, triangles = _evaluated_triangles(instance.object, np.array(instance.matrix_world))
+        if vertices is None:
+            continue
+        all_vertices.append(vertices)
+        all_triangles.append(triangles + amount_of_vertices)
+        amount_of_vertices += len(vertices)
+
+    if not all_vertices:
+        return BVHTree.FromPolygons([], [], all_triangles=True)
+
+    vertices = np.concatenate(all_vertices).tolist()
+    triangles = np.concatenate(all_triangles).tolist()
+    return BVHTree.FromPolygons(vertices, triangles, all_triangles=True)
+
+
+_geometry_types = {"MESH", "CURVE", "SURFACE", "META", "FONT"}
+
+
+def _evaluated_triangles(evaluated_obj, matrix_world):
+    """World space vertices and triangle vertex indices of an evaluated object, or None, None if it has no geometry."""
+    if evaluated_obj.type not in _geometry_types:
+        return None, None
+
+    mesh = evaluated_obj.to_mesh()
+    if mesh is None:
+        return None, None
+
+    mesh.calc_loop_triangles()
+    co = np.empty(3 * len(mesh.vertices), dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    triangles = np.empty(3 * len(mesh.loop_triangles), dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", triangles)
+    evaluated_obj.to_mesh_clear()
+
+    vertices = co.reshape(-1, 3) @ matrix_world[:3, :3].T + matrix_world[:3, 3]
+    return vertices, triangles.reshape(-1, 3)
+
+
+def _rays_to_camera(points, camera_obj):
+    """Origins, unit directions and lengths of the rays from points towards a camera."""
+    points = np.asarray(points, dtype=float)
+    camera_matrix = np.array(camera_obj.matrix_world)
+    camera_position = camera_matrix[:3, 3]
+
+    if camera_obj.data.type == "ORTHO":
+        # Rays of an orthographic camera are parallel to its viewing direction
+        backward = camera_matrix[:3, 2] / np.linalg.norm(camera_matrix[:3, 2])
+        distances = np.abs((camera_position - points) @ backward)
+        directions = np.broadcast_to(backward, points.shape)
+    else:
+        directions = camera_position - points
+        distances = np.linalg.norm(directions, axis=1)
+        directions = directions / np.where(distances > 0.0, distances, 1.0)[:, np.newaxis]
+
+    # Start the rays slightly away from the points to avoid hitting the surface the point lies on
+    offsets = 0.0001 * distances
+    origins = points + offsets[:, np.newaxis] * directions
+    return origins, directions, distances - offsets
+
+
+def _ray_cast_mask(bvh, origins, directions, distances, mask=None):
+    """Which rays hit the BVH tree, only casting the rays that are not masked out already."""
+    hits = np.zeros(len(origins), dtype=bool) if mask is None else mask
+    for i in np.flatnonzero(~hits):
+        location, _, _, _ = bvh.ray_cast(Vector(origins[i]), Vector(directions[i]), distances[i])
+        hits[i] = location is not None
+    return hits
+
+
+def _segments_hit_box(origins, directions, lengths, box_min, box_max):
+    """Slab test of many ray segments against one axis aligned box, to skip the rays that cannot hit the geometry in
+    it. Returns an (N,) mask that is True for the segments that intersect the box."""
+    directions = np.where(directions == 0.0, 1e-30, directions)  # parallel rays get infinite slab distances
+    near = (box_min - origins) / directions
+    far = (box_max - origins) / directions
+    t_enter = np.minimum(near, far).max(axis=1)
+    t_exit = np.maximum(near, far).min(axis=1)
+    return (t_enter <= t_exit) & (t_exit >= 0.0) & (t_enter <= lengths)
+
+
+def occluded_mask(points: np.ndarray, bvh: BVHTree, camera_obj) -> np.ndarray:
+    """Checks which points are occluded from the camera by casting rays from the points towards the camera.
+
+    Args:
+        points (np.ndarray): (N, 3) array of world space coordinates.
+        bvh (BVHTree): the occluding geometry, e.g. built with scene_bvh().
+        camera_obj (bpy.types.Object): the camera.
+
+    Returns:
+        np.ndarray: (N,) boolean mask.
+    """
+    origins, directions, distances = _rays_to_camera(points, camera_obj)
+    return _ray_cast_mask(bvh, origins, directions, distances)
+
+
+class VisibilityContext:
+    """Keeps a BVH tree per occluding object between visibility queries, e.g. while annotating many frames.
+
+    The trees are built in object space, so moving an object does not require rebuilding its tree. Only the rays that
+    pass through the bounding box of an object are cast against its tree. A tree is only
+    rebuilt when the evaluated geometry of its object changes, which is detected from the depsgraph updates while the
+    context is active. Objects that are added to the scene get a tree on the next query and removed objects are
+    dropped. Call invalidate() after changes that the depsgraph does not report.
+
+    Example:
+        with abt.VisibilityContext() as visibility_context:
+            for frame in range(start, end):
+                scene.frame_set(frame)
+                mask = abt.visible_vertices_mask(cloth, visibility_context=visibility_context)
+    """
+
+    def __init__(self):
+        self._object_bvhs = {}  # object name -> BVHTree in object space
+        self._object_bounds = {}  # object name -> (min, max) corners of its object space bounding box, or None
+        self._outdated = set()
+        self._active = False
+        self.amount_of_builds = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        """Start listening to depsgraph updates."""
+        if not self._active:
+            bpy.app.handlers.depsgraph_update_post.append(self._on_depsgraph_update)
+            bpy.app.handlers.frame_change_post.append(self._on_depsgraph_update)
+            self._active = True
 
+    def close(self):
+        """Stop listening to depsgraph updates and free the BVH trees."""
+        if self._active:
+            bpy.app.handlers.depsgraph_update_post.remove(self._on_depsgraph_update)
+            bpy.app.handlers.frame_change_post.remove(self._on_depsgraph_update)
+            self._active = False
+        self._object_bvhs.clear()
+        self._object_bounds.clear()
 
-def intersect_ray_quad_3d(quad, origin, destination):
-    ray = Vector(destination) - Vector(origin)
-    p = intersect_ray_tri(quad[0], quad[1], quad[2], ray, origin)
-    if p is None:
-        p = intersect_ray_tri(quad[2], quad[3], quad[0], ray, origin)
-    return p
+    def _on_depsgraph_update(self, scene, depsgraph):
+        for update in depsgraph.updates:
+            if isinstance(update.id, bpy.types.Object) and update.is_updated_geometry:
+                self._outdated.add(update.id.original.name)
 
+    def invalidate(self, obj=None):
+        """Rebuild the tree of an object, or of all objects if none is given, on the next query."""
+        if obj is None:
+            self._object_bvhs.clear()
+            self._object_bounds.clear()
+        else:
+            self._outdated.add(obj.name)
+
+    def _occluder_instances(self, depsgraph=None):
+        """Brings the trees up to date and returns the (object name, world matrix) of every occluding instance."""
+        depsgraph = bpy.context.evaluated_depsgraph_get() if depsgraph is None else depsgraph
+
+        instances = []
+        for instance in depsgraph.object_instances:
+            evaluated_obj = instance.object
+            name = evaluated_obj.original.name
+
+            if name not in self._object_bvhs or name in self._outdated:
+                vertices, triangles = _evaluated_triangles(evaluated_obj, np.identity(4))
+                if vertices is None:
+                    continue
+                self._object_bvhs[name] = BVHTree.FromPolygons(
+                    vertices.tolist(), triangles.tolist(), all_triangles=True
+                )
+                if len(triangles) == 0:
+                    self._object_bounds[name] = None
+                else:
+                    margin = 1e-6 * (1.0 + np.abs(vertices).max())  # the BVH tree may round the vertices
+                    self._object_bounds[name] = vertices.min(axis=0) - margin, vertices.max(axis=0) + margin
+                self._outdated.discard(name)
+                self.amount_of_builds += 1
+
+            instances.append((name, np.array(instance.matrix_world)))
+
+        for name in set(self._object_bvhs) - {name for name, _ in instances}:
+            del self._object_bvhs[name]
+            del self._object_bounds[name]
+
+        return instances
+
+    def occluded_mask(self, points: np.ndarray, camera_obj, depsgraph=None) -> np.ndarray:
+        """Same as the module level occluded_mask(), but using the cached BVH trees."""
+        return self._occluded_mask(points, camera_obj, self._occluder_instances(depsgraph))
+
+    def _occluded_mask(self, points, camera_obj, instances):
+        origins, directions, distances = _rays_to_camera(points, camera_obj)
+        occluded = np.zeros(len(origins), dtype=bool)
+
+        for name, matrix_world in instances:
+            remaining = np.flatnonzero(~occluded)
+            if len(remaining) == 0:
+                break
+            if self._object_bounds[name] is None:
+                continue
+
+            # Cast the rays in object space, the ray lengths scale with the object's scale
+            world_to_object = np.linalg.inv(matrix_world)
+            origins_object = origins[remaining] @ world_to_object[:3, :3].T + world_to_object[:3, 3]
+            directions_object = directions[remaining] @ world_to_object[:3, :3].T
+            scales = np.linalg.norm(directions_object, axis=1)
+            directions_object /= np.where(scales > 0.0, scales, 1.0)[:, np.newaxis]
+            lengths = distances[remaining] * scales
+
+            hits_box = np.flatnonzero(
+                _segments_hit_box(origins_object, directions_object, lengths, *self._object_bounds[name])
+            )
+            if len(hits_box) == 0:
+                continue
+            bvh = self._object_bvhs[name]
+            occluded[remaining[hits_box]] = _ray_cast_mask(
+                bvh, origins_object[hits_box], directions_object[hits_box], lengths[hits_box]
+            )
+
+        return occluded
+
+
+class DepthMap:
+    """Depth image of a camera view, for visibility tests that scale with the image size instead of with the amount
+    of points times the complexity of the scene. Render one with render_depth_map() and share it between all objects
+    in a frame.
+
+    The view projection matrix of the camera is stored when the depth map is created, so it stays valid for the frame
+    in which it was rendered even if the camera moves afterwards. Querying it at another frame gives a warning, as the
+    scene geometry may have moved since.
+    """
+
+    def __init__(self, depth: np.ndarray, camera_obj, scene=None):
+        """
+        Args:
+            depth (np.ndarray): (height, width) array with the depth along the viewing direction of the camera of each
+                                pixel, starting at the top left pixel.
+            camera_obj (bpy.types.Object): the camera from which the depth was rendered.
+            scene (bpy.types.Scene, optional): the scene, which determines the aspect ratio. Defaults to the active
+                                               scene.
+        """
+        scene = bpy.context.scene if scene is None else scene
+        self.depth = np.asarray(depth, dtype=np.float32)
+        self.camera_name = camera_obj.name
+        self.frame = scene.frame_current
+        self._camera_view = _camera_view(camera_obj, scene)
+
+    def visible_mask(self, points: np.ndarray, tolerance: float = 0.01) -> np.ndarray:
+        """Checks which points are visible by comparing their depth to the depth of the pixel they project onto.
 
-def intersect_ray_scene(scene, origin, destination):
-    direction = destination - origin
-    result, _, _, _, object, _ = scene.ray_cast(
-        bpy.context.view_layer.depsgraph,
-        origin=origin + direction * 0.0001,
-        direction=destination,
+        Args:
+            points (np.ndarray): (N, 3) array of world space coordinates.
+            tolerance (float, optional): how far (in meters) a point may lie behind the rendered surface and still be
+                                         visible. Points on a surface that is steep to the camera deviate more from
+                                         the depth of their pixel in low resolution depth maps. Defaults to 0.01.
+
+        Returns:
+            np.ndarray: (N,) boolean mask.
+        """
+        if bpy.context.scene.frame_current != self.frame:
+            warnings.warn(
+                f"The depth map was rendered at frame {self.frame}, but the current frame is "
+                f"{bpy.context.scene.frame_current}."
+            )
+
+        view_xy, depths = _view_coordinates(np.asarray(points, dtype=float).reshape(-1, 3), self._camera_view)
+        inside = (depths > 0.0) & np.all((view_xy >= 0.0) & (view_xy <= 1.0), axis=1)
+
+        height, width = self.depth.shape
+        columns = np.clip((view_xy[:, 0] * width).astype(int), 0, width - 1)
+        rows = np.clip(((1.0 - view_xy[:, 1]) * height).astype(int), 0, height - 1)
+        return inside & (depths <= self.depth[rows, columns] + tolerance)
+
+
+_compositor_output_types = {"COMPOSITE", "OUTPUT_FILE", "VIEWER", "SPLITVIEWER"}
+
+
+def render_depth_map(camera_obj=None, scene=None, resolution_percentage: int = 25) -> DepthMap:
+    """Render a low resolution depth pass of the scene with Cycles at one sample per pixel.
+
+    Only the active view layer is rendered and the depth pass is read from a temporary compositor Viewer node. The
+    output nodes of the scene's compositor tree (e.g. File Output and Composite nodes) are muted during the render,
+    and they and all render settings that are changed for this are restored afterwards, so nothing is written to disk.
+
+    Args:
+        camera_obj (bpy.types.Object, optional): the camera to render from. Defaults to the scene camera.
+        scene (bpy.types.Scene, optional): Defaults to the active scene.
+        resolution_percentage (int, optional): the resolution of the depth map, as a percentage of the render
+                                               resolution of the scene. Defaults to 25.
+
+    Returns:
+        DepthMap: the depth map.
+    """
+    scene = bpy.context.scene if scene is None else scene
+    camera_obj = scene.camera if camera_obj is None else camera_obj
+    view_layer = bpy.context.view_layer
+    render = scene.render
+
+    saved_settings = (
+        scene.camera,
+        render.engine,
+        render.resolution_percentage,
+        render.use_compositing,
+        render.use_single_layer,
+        scene.cycles.samples,
+        view_layer.use_pass_z,
+        scene.use_nodes,
     )
-    return result
+    scene.camera = camera_obj
+    render.engine = "CYCLES"
+    render.resolution_percentage = resolution_percentage
+    render.use_compositing = True
+    render.use_single_layer = True
+    scene.cycles.samples = 1
+    view_layer.use_pass_z = True
+    scene.use_nodes = True
 
+    # Mute the outputs of the scene's own compositor tree, so nothing is written or composited at the low resolution
+    nodes, links = scene.node_tree.nodes, scene.node_tree.links
+    output_nodes = [node for node in nodes if node.type in _compositor_output_types]
+    saved_mutes = [node.mute for node in output_nodes]
+    for node in output_nodes:
+        node.mute = True
 
-def is_visible(co: Vector):
-    """Checks if a vertex is visible from the scene camera.
+    render_layers = nodes.new("CompositorNodeRLayers")
+    render_layers.layer = view_layer.name
+    viewer = nodes.new("CompositorNodeViewer")
+    viewer.use_alpha = False
+    nodes.active = viewer
+    links.new(render_layers.outputs["Depth"], viewer.inputs["Image"])
+
+    try:
+        bpy.ops.render.render(write_still=False, layer=view_layer.name, scene=scene.name)
+        image = bpy.data.images["Viewer Node"]
+        width, height = image.size
+        pixels = np.empty(4 * width * height, dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+    finally:
+        nodes.remove(viewer)
+        nodes.remove(render_layers)
+        for node, mute in zip(output_nodes, saved_mutes):
+            node.mute = mute
+        (
+            scene.camera,
+            render.engine,
+            render.resolution_percentage,
+            render.use_compositing,
+            render.use_single_layer,
+            scene.cycles.samples,
+            view_layer.use_pass_z,
+            scene.use_nodes,
+        ) = saved_settings
+
+    # Blender images start at the bottom left pixel, the depth is stored in the color channels
+    depth = pixels.reshape(height, width, 4)[::-1, :, 0].copy()
+    return DepthMap(depth, camera_obj, scene)
+
+
+def visible_vertices_mask(
+    obj,
+    camera_obj=None,
+    bvh: BVHTree = None,
+    visibility_context: VisibilityContext = None,
+    depth_map: DepthMap = None,
+) -> np.ndarray:
+    """Checks which vertices of a mesh object are visible from a camera. Only the vertices inside the view frustum are
+    ray cast against the scene geometry.
 
     Args:
-        co (Vector): the world space x, y and z coordinates of the vertex.
+        obj (bpy.types.Object): the mesh object.
+        camera_obj (bpy.types.Object, optional): the camera. Defaults to the scene camera.
+        bvh (BVHTree, optional): the occluding geometry. Defaults to a new scene_bvh(), pass one to reuse it.
+        visibility_context (VisibilityContext, optional): use the cached BVH trees of this context instead of bvh.
+        depth_map (DepthMap, optional): compare the vertex depths to this depth map instead of ray casting. The
+                                        camera_obj argument is ignored then, the camera of the depth map is used.
 
     Returns:
-        boolean: visibility
+        np.ndarray: boolean mask with the visibility of each vertex.
+    """
+    scene = bpy.context.scene
+    camera_obj = scene.camera if camera_obj is None else camera_obj
+    points = _vertex_coordinates(obj)
+    if depth_map is not None:
+        return depth_map.visible_mask(points)
+
+    bvh = scene_bvh() if bvh is None and visibility_context is None else bvh
+    return _visible_mask(points, camera_obj, scene, bvh, visibility_context)
+
+
+def visible_vertices_masks(
+    obj,
+    cameras,
+    bvh: BVHTree = None,
+    visibility_context: VisibilityContext = None,
+    depth_maps: List[DepthMap] = None,
+) -> np.ndarray:
+    """Checks which vertices of a mesh object are visible from each of several cameras. The vertices are read and the
+    scene BVH tree is built only once for all cameras, see visible_vertices_mask() for the arguments.
+
+    Args:
+        obj (bpy.types.Object): the mesh object.
+        cameras (list): the camera objects.
+        depth_maps (List[DepthMap], optional): one depth map per camera, used instead of ray casting.
+
+    Returns:
+        np.ndarray: (n_cameras, n_vertices) boolean mask.
+    """
+    points = _vertex_coordinates(obj)
+    if depth_maps is not None:
+        return _depth_map_masks(points, depth_maps)
+
+    bvh = scene_bvh() if bvh is None and visibility_context is None else bvh
+    return _visible_masks(points, cameras, bpy.context.scene, bvh, visibility_context)
+
+
+def are_visible(
+    points: np.ndarray,
+    camera=None,
+    bvh: BVHTree = None,
+    visibility_context: VisibilityContext = None,
+    depth_map: DepthMap = None,
+) -> np.ndarray:
+    """Checks which points are visible from a camera. The view layer is updated and the camera frustum is computed
+    only once for all points.
+
+    Args:
+        points (np.ndarray): (N, 3) array of world space coordinates.
+        camera (bpy.types.Object, optional): the camera. Defaults to the scene camera.
+        bvh (BVHTree, optional): the occluding geometry. By default the points are ray cast against the scene, which is
+                                 cheaper than building a BVH tree when there are only a few points.
+        visibility_context (VisibilityContext, optional): use the cached BVH trees of this context instead.
+        depth_map (DepthMap, optional): compare the point depths to this depth map instead of ray casting.
+
+    Returns:
+        np.ndarray: (N,) boolean mask.
     """
-    co = Vector(co)
+    if depth_map is not None:
+        return depth_map.visible_mask(points)
 
     bpy.context.view_layer.update()  # ensures camera matrix is up to date
     scene = bpy.context.scene
-    camera_obj = scene.camera  # bpy.types.Object
-    camera = bpy.data.cameras[camera_obj.name]  # bpy.types.Camera
-
-    view_frame = [camera_obj.matrix_world @ v for v in camera.view_frame(scene=scene)]
-    view_center = sum(view_frame, Vector((0, 0, 0))) / len(view_frame)
-    view_normal = (view_center - camera_obj.location).normalized()
-
-    d = None
-    intersection = intersect_ray_quad_3d(
-        view_frame, co, camera_obj.location
-    )  # check intersection with the camera frame
-
-    if intersection is not None:
-        d = intersection - co
-        # only take into account vertices in front of the camera, not behind it.
-        if d.dot(view_normal) < 0:
-            d = d.length
-            # check intersection with all other objects in scene. We revert the direction,
-            # ie. look from the camera to avoid self intersection
-            if intersect_ray_scene(scene, co, camera_obj.location):
-                d = None
+    camera = scene.camera if camera is None else camera
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    return _visible_mask(points, camera, scene, bvh, visibility_context)
+
+
+def are_visible_from_cameras(
+    points: np.ndarray,
+    cameras,
+    bvh: BVHTree = None,
+    visibility_context: VisibilityContext = None,
+    depth_maps: List[DepthMap] = None,
+) -> np.ndarray:
+    """Checks which points are visible from each of several cameras, e.g. the views of a stereo or multi-view rig.
+    The occluding geometry is gathered only once for all cameras, see are_visible() for the arguments.
+
+    Args:
+        points (np.ndarray): (N, 3) array of world space coordinates.
+        cameras (list): the camera objects.
+        depth_maps (List[DepthMap], optional): one depth map per camera, used instead of ray casting.
+
+    Returns:
+        np.ndarray: (n_cameras, N) boolean mask.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    if depth_maps is not None:
+        return _depth_map_masks(points, depth_maps)
+
+    bpy.context.view_layer.update()  # ensures camera matrices are up to date
+    return _visible_masks(points, cameras, bpy.context.scene, bvh, visibility_context)
+
+
+def _depth_map_masks(points, depth_maps):
+    masks = np.zeros((len(depth_maps), len(points)), dtype=bool)
+    for i, depth_map in enumerate(depth_maps):
+        masks[i] = depth_map.visible_mask(points)
+    return masks
+
+
+def _visible_mask(points, camera_obj, scene, bvh=None, visibility_context=None):
+    return _visible_masks(points, [camera_obj], scene, bvh, visibility_context)[0]
+
+
+def _visible_masks(points, cameras, scene, bvh=None, visibility_context=None):
+    """Frustum culling followed by occlusion tests for the remaining points, against the visibility context, the BVH
+    tree or otherwise the scene itself, in that order of preference. Returns an (n_cameras, N) mask."""
+    visible = np.zeros((len(cameras), len(points)), dtype=bool)
+    instances = None
+
+    for i, camera_obj in enumerate(cameras):
+        visible[i] = frustum_mask(points, camera_obj, scene)
+        candidates = np.flatnonzero(visible[i])
+        if len(candidates) == 0:
+            continue
+
+        if visibility_context is not None:
+            if instances is None:
+                instances = visibility_context._occluder_instances()
+            occluded = visibility_context._occluded_mask(points[candidates], camera_obj, instances)
+        elif bvh is not None:
+            occluded = occluded_mask(points[candidates], bvh, camera_obj)
         else:
-            d = None
+            occluded = _scene_occluded_mask(points[candidates], camera_obj, scene)
+        visible[i, candidates] = ~occluded
 
-    visible = d is not None and d > 0.0
     return visible
 
 
-def visible_vertices(obj):
-    scene = bpy.context.scene
-    cam_ob = scene.camera
-    cam = bpy.data.cameras[cam_ob.name]  # camera in scene is object type, not a camera type
-    cam_mat = cam_ob.matrix_world
-    view_frame = cam.view_frame(
-        scene=scene
-    )  # without a scene the aspect ratio of the camera is not taken into account
-    view_frame = [cam_mat @ v for v in view_frame]
-    cam_pos = cam_mat @ Vector((0, 0, 0))
-    view_center = sum(view_frame, Vector((0, 0, 0))) / len(view_frame)
-    view_normal = (view_center - cam_pos).normalized()
-
-    mesh_mat = obj.matrix_world
-    mesh = obj.data
+def _scene_occluded_mask(points, camera_obj, scene):
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    origins, directions, distances = _rays_to_camera(points, camera_obj)
+    occluded = np.zeros(len(points), dtype=bool)
+    for i, (origin, direction, distance) in enumerate(zip(origins, directions, distances)):
+        result, _, _, _, _, _ = scene.ray_cast(depsgraph, Vector(origin), Vector(direction), distance=distance)
+        occluded[i] = result
+    return occluded
+
 
-    visible_vertices = []
-
-    for v in mesh.vertices:
-        vertex_coords = mesh_mat @ v.co
-        d = None
-        intersection = intersect_ray_quad_3d(
-            view_frame, vertex_coords, cam_pos
-        )  # check intersection with the camera frame
-
-        if intersection is not None:
-            d = intersection - vertex_coords
-            # only take into account vertices in front of the camera, not behind it.
-            if d.dot(view_normal) < 0:
-                d = d.length
-                # check intersection with all other objects in scene. We revert the direction,
-                # ie. look from the camera to avoid self intersection
-                if intersect_ray_scene(scene, vertex_coords, cam_pos):
-                    d = None
-            else:
-                d = None
-
-        visible = d is not None and d > 0.0
-
-        if visible:
-            visible_vertices.append(v.index)
-
-    return visible_vertices
+def visible_vertices(
+    obj,
+    camera_obj=None,
+    bvh: BVHTree = None,
+    visibility_context: VisibilityContext = None,
+    depth_map: DepthMap = None,
+) -> List[int]:
+    """Indices of the vertices of a mesh object that are visible from a camera, see visible_vertices_mask()."""
+    return np.flatnonzero(visible_vertices_mask(obj, camera_obj, bvh, visibility_context, depth_map)).tolist()
@@ -0,0 +1,103 @@
+import importlib
+from pathlib import Path
+
+import pytest
+from diskcache import Cache
+
+import airo_blender_toolkit as abt
+
+# The module itself, the package exports its assets() function under the same name
+asset_cache = importlib.import_module("airo_blender_toolkit.assets")
+
+
+class FakeLibrary:
+    """Asset Library with one object asset per blend file, named after the file, and no actual blend files."""
+
+    def __init__(self):
+        self.signatures = {}
+        self.scanned = []
+
+    def library_blend_files(self):
+        return {blend_file: ("TestLibrary", signature) for blend_file, signature in self.signatures.items()}
+
+    def load_blend_file_assets(self, blend_file):
+        self.scanned.append(blend_file)
+        return {"objects": [Path(blend_file).stem]}
+
+
+def _process_assets(assets_to_be_processed, library_name, blend_file):
+    return [
+        abt.Asset(asset_name, library_name, asset_type, [], blend_file)
+        for asset_type, asset_names in assets_to_be_processed.items()
+        for asset_name in asset_names
+    ]
+
+
+@pytest.fixture
+def library(monkeypatch, tmp_path):
+    library = FakeLibrary()
+    library.signatures = {"/library/a.blend": (1, 100), "/library/b.blend": (1, 200)}
+    monkeypatch.setattr(asset_cache, "cache_directory", lambda: str(tmp_path / "cache"))
+    monkeypatch.setattr(asset_cache, "_library_blend_files", library.library_blend_files)
+    monkeypatch.setattr(asset_cache, "load_blend_file_assets", library.load_blend_file_assets)
+    monkeypatch.setattr(asset_cache, "process_assets", _process_assets)
+    return library
+
+
+def _asset_names():
+    return sorted(asset.name for asset in asset_cache.assets())
+
+
+def test_first_update_scans_all_blend_files(library):
+    assert asset_cache.asset_cache_outdated()
+    assert asset_cache.update_asset_cache() == 2
+    assert not asset_cache.asset_cache_outdated()
+    assert _asset_names() == ["a", "b"]
+
+
+def test_adding_a_blend_file_scans_only_that_file(library):
+    asset_cache.update_asset_cache()
+    library.signatures["/library/c.blend"] = (1, 300)
+    library.scanned.clear()
+
+    assert asset_cache.asset_cache_outdated()
+    assert asset_cache.update_asset_cache() == 1
+    assert library.scanned == ["/library/c.blend"]
+    assert not asset_cache.asset_cache_outdated()
+    assert _asset_names() == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize("signature", [(2, 100), (1, 101)], ids=["mtime", "size"])
+def test_changing_a_blend_file_rescans_only_that_file(library, signature):
+    asset_cache.update_asset_cache()
+    library.signatures["/library/a.blend"] = signature
+    library.scanned.clear()
+
+    assert asset_cache.asset_cache_outdated()
+    assert asset_cache.update_asset_cache() == 1
+    assert library.scanned == ["/library/a.blend"]
+    assert not asset_cache.asset_cache_outdated()
+
+
+def test_removing_a_blend_file_drops_its_assets(library):
+    asset_cache.update_asset_cache()
+    del library.signatures["/library/b.blend"]
+    library.scanned.clear()
+
+    assert asset_cache.asset_cache_outdated()
+    assert asset_cache.update_asset_cache() == 0
+    assert library.scanned == []
+    assert _asset_names() == ["a"]
+
+
+def test_old_cache_format_is_migrated(library):
+    with Cache(asset_cache.cache_directory()) as cache:
+        cache["processed_blend_files"] = ["/library/a.blend"]
+        cache["assets"] = [abt.Asset("old", "TestLibrary", "objects", [], "/library/a.blend")]
+
+    assert asset_cache.asset_cache_outdated()
+    assert asset_cache.update_asset_cache() == 2
+    assert not asset_cache.asset_cache_outdated()
+    assert _asset_names() == ["a", "b"]
+    with Cache(asset_cache.cache_directory()) as cache:
+        assert "processed_blend_files" not in cache
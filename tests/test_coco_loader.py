@@ -0,0 +1,98 @@
+import json
+import os
+
+import numpy as np
+
+import airo_blender_toolkit as abt
+
+categories = [
+    dict(supercategory="towel", id=1, name="towel", keypoints=["a", "b"], skeleton=[]),
+    dict(supercategory="shirt", id=2, name="shirt", keypoints=["a"], skeleton=[]),
+]
+
+
+def _write_dataset(path):
+    images = [dict(id=image_id, file_name=f"{image_id}.png", width=64, height=48, license=None) for image_id in (7, 8)]
+    annotations = [
+        dict(
+            id=1,
+            image_id=8,
+            category_id=1,
+            segmentation=[],
+            area=4.0,
+            bbox=[0, 0, 2, 2],
+            iscrowd=0,
+            keypoints=[1, 2, 2, 3, 4, 2],
+        ),
+        dict(
+            id=2,
+            image_id=7,
+            category_id=2,
+            segmentation=[],
+            area=1.0,
+            bbox=[1, 1, 1, 1],
+            iscrowd=0,
+            keypoints=[5, 6, 1],
+        ),
+        dict(
+            id=3,
+            image_id=8,
+            category_id=2,
+            segmentation=[],
+            area=1.0,
+            bbox=[2, 2, 1, 1],
+            iscrowd=0,
+            keypoints=[7, 8, 2],
+        ),
+    ]
+    with open(path, "w") as file:
+        json.dump(dict(images=images, categories=categories, annotations=annotations), file)
+
+
+def test_load_coco_keypoints(tmp_path):
+    path = tmp_path / "coco.json"
+    _write_dataset(path)
+    dataset = abt.load_coco_keypoints(path, validate=True)
+
+    assert len(dataset) == 3
+    assert dataset.keypoints.shape == (3, 2, 3)
+    assert np.allclose(dataset.keypoints[1], [[5, 6, 1], [0, 0, 0]])  # padded to the largest amount of keypoints
+    assert dataset.bbox.shape == (3, 4)
+    assert dataset.annotations_of_image(8).tolist() == [0, 2]
+    assert dataset.annotations_of_category(2).tolist() == [1, 2]
+    assert dataset.annotations_of_image(9).tolist() == []
+
+
+def test_npz_cache(tmp_path):
+    path, cache_path = tmp_path / "coco.json", tmp_path / "coco.cache"
+    _write_dataset(path)
+    dataset = abt.load_coco_keypoints(path, cache_path=cache_path)
+    cached = abt.load_coco_keypoints(path, cache_path=cache_path)
+
+    assert cached.categories == categories
+    for name in abt.CocoKeypointsArrays._array_names:
+        assert np.array_equal(getattr(cached, name), getattr(dataset, name))
+
+
+def test_npz_cache_compares_source_path_and_size(tmp_path):
+    path, other_path, cache_path = tmp_path / "coco.json", tmp_path / "other.json", tmp_path / "coco.cache"
+    _write_dataset(path)
+    amount_of_annotations = len(abt.load_coco_keypoints(path, cache_path=cache_path))
+    with open(path) as file:
+        data = json.load(file)
+    data["annotations"] = data["annotations"][:1]
+    mtime_ns = os.stat(path).st_mtime_ns
+
+    # Another file with the same modification time is not served from the cache
+    with open(other_path, "w") as file:
+        json.dump(data, file)
+    os.utime(other_path, ns=(mtime_ns, mtime_ns))
+    assert len(abt.load_coco_keypoints(other_path, cache_path=cache_path)) == 1
+
+    # Nor is the original file after it is replaced by one with an older modification time than the cache
+    abt.load_coco_keypoints(path, cache_path=cache_path)
+    with open(path, "w") as file:
+        json.dump(data, file)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    assert amount_of_annotations > 1
+    assert len(abt.load_coco_keypoints(path, cache_path=cache_path)) == 1
@@ -0,0 +1,65 @@
+import json
+
+import airo_blender_toolkit as abt
+from airo_blender_toolkit.coco_parser import CocoImage, CocoKeypoints
+from airo_blender_toolkit.coco_writer import _remove_unfinished_line
+
+category = dict(supercategory="towel", id=1, name="towel", keypoints=["corner"], skeleton=[])
+
+
+def _annotation(annotation_id, image_id):
+    return dict(
+        id=annotation_id,
+        image_id=image_id,
+        category_id=1,
+        segmentation=[],
+        area=1.0,
+        bbox=[0, 0, 1, 1],
+        iscrowd=0,
+        keypoints=[10.0, 20.0, 2],
+    )
+
+
+def test_merge_remaps_ids(tmp_path):
+    for worker_id in range(2):
+        with abt.CocoShardWriter(tmp_path, worker_id=worker_id) as writer:
+            for image_id in range(3):
+                writer.write_image(CocoImage(file_name=f"{worker_id}_{image_id}.png", height=8, width=8, id=image_id))
+                writer.write_annotation(_annotation(0, image_id))
+
+    output_path = tmp_path / "coco.json"
+    assert abt.merge_coco_shards(str(tmp_path), output_path, [category]) == (6, 6)
+
+    with open(output_path) as file:
+        coco = CocoKeypoints(**json.load(file))
+    assert [image.id for image in coco.images] == list(range(1, 7))
+    assert [annotation.id for annotation in coco.annotations] == list(range(1, 7))
+    file_names = {image.id: image.file_name for image in coco.images}
+    assert [file_names[annotation.image_id] for annotation in coco.annotations][3] == "1_0.png"
+
+
+def test_unfinished_line_is_dropped(tmp_path):
+    with abt.CocoShardWriter(tmp_path) as writer:
+        writer.write_image(dict(file_name="0.png", height=8, width=8, id=0, license=None))
+    with open(tmp_path / "shard_00000.jsonl", "a") as file:
+        file.write('{"image": {"file_na')
+
+    with abt.CocoShardWriter(tmp_path) as writer:
+        writer.write_image(dict(file_name="1.png", height=8, width=8, id=1, license=None))
+
+    assert abt.merge_coco_shards(str(tmp_path), tmp_path / "coco.json", [category]) == (2, 0)
+
+
+def test_remove_unfinished_line_across_chunks(tmp_path):
+    path = tmp_path / "shard.jsonl"
+    cases = [
+        (b'{"a": 1}\n{"b": 2}\n{"c": 3', b'{"a": 1}\n{"b": 2}\n'),
+        (b'{"a": 1}\n{"b": 2}\n', b'{"a": 1}\n{"b": 2}\n'),
+        (b'{"unfinished": ', b""),
+        (b"", b""),
+    ]
+    for content, expected in cases:
+        for chunk_size in [1, 3, 64]:
+            path.write_bytes(content)
+            _remove_unfinished_line(path, chunk_size)
+            assert path.read_bytes() == expected
@@ -1,3 +1,6 @@
+import numpy as np
+import pytest
+
 from airo_blender_toolkit.datastructures import InterpolatingDict
 
 
@@ -8,3 +11,61 @@ def test_interpotations():
     assert d[0.5] == 1.0
     assert d[0.25] == 0.5
     assert d[1.0 / 3] == 2.0 / 3
+
+
+def test_interpolation_after_insert():
+    d = InterpolatingDict()
+    d[1.0] = 2.0
+    d[0.0] = 0.0
+    assert d[0.5] == 1.0
+    d[0.5] = 0.0
+    assert d[0.5] == 0.0
+    assert d[0.75] == 1.0
+
+
+def test_clamping():
+    d = InterpolatingDict({0.0: 1.0, 1.0: 3.0})
+    assert d[-1.0] == 1.0
+    assert d[2.0] == 3.0
+
+
+def test_lookup():
+    d = InterpolatingDict.from_arrays([1.0, 0.0, 0.5], [2.0, 0.0, 1.0])
+    keys = np.array([-0.5, 0.0, 0.25, 1.0 / 3, 0.75, 1.0, 1.5])
+    expected = np.array([d[key] for key in keys])
+    assert np.allclose(d.lookup(keys), expected)
+    assert np.allclose(d.lookup(keys), [0.0, 0.0, 0.5, 2.0 / 3, 1.5, 2.0, 2.0])
+
+
+def test_lookup_array_values():
+    d = InterpolatingDict()
+    d[0.0] = np.array([0.0, 0.0, 0.0])
+    d[1.0] = np.array([1.0, 2.0, 3.0])
+    values = d.lookup(np.array([0.0, 0.5, 2.0]))
+    assert values.shape == (3, 3)
+    assert np.allclose(values[1], [0.5, 1.0, 1.5])
+    assert np.allclose(values[2], [1.0, 2.0, 3.0])
+
+
+def test_in_place_union_invalidates():
+    d = InterpolatingDict({0.0: 0.0, 1.0: 4.0})
+    assert d[0.5] == 2.0
+    d |= {0.5: 10.0}
+    assert d[0.5] == 10.0
+    assert d[0.25] == 5.0
+
+
+def test_fromkeys():
+    d = InterpolatingDict.fromkeys([0.0, 1.0], 3.0)
+    assert isinstance(d, InterpolatingDict)
+    assert d[0.5] == 3.0
+
+
+def test_from_arrays_rejects_duplicate_keys():
+    with pytest.raises(ValueError):
+        InterpolatingDict.from_arrays([0.0, 1.0, 0.0], [1.0, 2.0, 3.0])
+
+
+def test_from_arrays_rejects_mismatched_lengths():
+    with pytest.raises(ValueError):
+        InterpolatingDict.from_arrays([0.0, 1.0], [1.0, 2.0, 3.0])
@@ -0,0 +1,128 @@
+import bpy
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation
+
+import airo_blender_toolkit as abt
+from airo_blender_toolkit.keyframe import decimate_keyframes
+
+
+def test_decimate_linear_motion():
+    frames = np.arange(1000, dtype=float)
+    values = np.stack([frames, 2 * frames, np.zeros_like(frames)], axis=1)
+    kept = decimate_keyframes(frames, values, tolerance=1e-6)
+    assert list(kept) == [0, 999]
+
+
+def test_decimate_within_tolerance():
+    frames = np.arange(200, dtype=float)
+    angles = np.linspace(0, np.pi, len(frames))
+    values = np.stack([np.cos(angles), np.sin(angles), np.zeros_like(angles)], axis=1)
+
+    for tolerance in [1e-2, 1e-3]:
+        kept = decimate_keyframes(frames, values, tolerance)
+        assert kept[0] == 0 and kept[-1] == len(frames) - 1
+        assert len(kept) < len(frames)
+
+        reconstructed = np.stack([np.interp(frames, frames[kept], values[kept, i]) for i in range(3)], axis=1)
+        assert np.linalg.norm(reconstructed - values, axis=1).max() <= tolerance
+
+
+def _world_matrices(object, frames):
+    scene = bpy.context.scene
+    matrices = []
+    for frame in frames:
+        scene.frame_set(frame)
+        matrices.append(np.array(object.matrix_world))
+    return np.array(matrices)
+
+
+@pytest.mark.parametrize("delta_location", [(0.0, 0.0, 0.0), (0.5, -1.0, 2.0)])
+def test_keyframe_trajectory_bulk_matches_keyframe_insert(delta_location):
+    start_orientation = Rotation.from_euler("xyz", [0.1, 0.2, 0.3]).as_matrix()
+    end_orientation = Rotation.from_euler("xyz", [1.0, -0.5, 2.0]).as_matrix()
+    control_points = np.array([[0.0, 0.0, 0.0], [1.0, 2.0, 0.0], [2.0, -1.0, 1.0], [3.0, 0.0, 2.0]])
+    trajectory = abt.Trajectory(abt.BezierPath(control_points, start_orientation, end_orientation))
+
+    objects = []
+    for bulk in [True, False]:
+        object = bpy.data.objects.new(f"TestEmpty{bulk}", None)
+        bpy.context.scene.collection.objects.link(object)
+        object.delta_location = delta_location
+        abt.keyframe_trajectory(object, trajectory, 1, 30, bulk=bulk)
+        objects.append(object)
+
+    scene = bpy.context.scene
+    original_frame = scene.frame_current
+    frames = list(range(1, 30))
+    bulk_matrices, insert_matrices = (_world_matrices(object, frames) for object in objects)
+    scene.frame_set(original_frame)
+
+    for object in objects:
+        bpy.data.objects.remove(object)
+
+    assert np.allclose(bulk_matrices, insert_matrices, atol=1e-5)
+    assert np.allclose(bulk_matrices, trajectory.poses(np.linspace(0.0, 1.0, len(frames))), atol=1e-5)
+
+
+def test_keyframe_index_follows_inserted_and_removed_keys():
+    object = bpy.data.objects.new("TestKeyframed", None)
+    bpy.context.scene.collection.objects.link(object)
+    assert not abt.is_keyframed(object, 1)
+
+    for frame in [1, 5, 10]:
+        object.keyframe_insert(data_path="location", frame=frame)
+    assert abt.is_keyframed(object, 5)
+    assert abt.is_keyframed(object, 5.0)
+    assert not abt.is_keyframed(object, 5.5)
+    assert abt.next_keyframe(object, 1) == 5
+
+    object.keyframe_delete(data_path="location", frame=5)
+    assert not abt.is_keyframed(object, 5)
+    assert abt.next_keyframe(object, 1) == 10
+
+    object.keyframe_insert(data_path="location", frame=20)
+    assert abt.next_keyframe(object, 10) == 20
+
+    # A new action in place of a removed one must not reuse the index of the removed action
+    bpy.data.actions.remove(object.animation_data.action)
+    object.keyframe_insert(data_path="location", frame=3)
+    assert abt.is_keyframed(object, 3)
+    assert not abt.is_keyframed(object, 1)
+    assert abt.next_keyframe(object, 3) is None
+
+    bpy.data.actions.remove(object.animation_data.action)
+    bpy.data.objects.remove(object)
+
+
+def test_keyframe_trajectory_warns_when_tolerance_is_ignored():
+    orientation = np.identity(3)
+    trajectory = abt.Trajectory(abt.LinearPath(np.zeros(3), np.ones(3), orientation))
+    object = bpy.data.objects.new("TestEmpty", None)
+    bpy.context.scene.collection.objects.link(object)
+
+    with pytest.warns(UserWarning):
+        abt.keyframe_trajectory(object, trajectory, 1, 10, bulk=False, position_tolerance=0.01)
+
+    bpy.data.objects.remove(object)
+
+
+def test_keyframe_trajectory_empty_and_single_frame_ranges():
+    trajectory = abt.Trajectory(abt.LinearPath(np.zeros(3), np.ones(3), np.identity(3)))
+
+    for bulk in [True, False]:
+        object = bpy.data.objects.new("TestEmpty", None)
+        bpy.context.scene.collection.objects.link(object)
+
+        abt.keyframe_trajectory(object, trajectory, 5, 5, bulk=bulk)
+        assert object.animation_data is None or object.animation_data.action is None
+
+        abt.keyframe_trajectory(object, trajectory, 5, 6, bulk=bulk)
+        fcurves = object.animation_data.action.fcurves
+        location_keys = [fcurves.find("location", index=i).keyframe_points for i in range(3)]
+        assert [len(keys) for keys in location_keys] == [1, 1, 1]
+        assert [tuple(keys[0].co) for keys in location_keys] == [(5.0, 0.0)] * 3
+
+        action = object.animation_data.action
+        bpy.data.objects.remove(object)
+        bpy.data.actions.remove(action)
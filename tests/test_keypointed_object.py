@@ -0,0 +1,113 @@
+import bpy
+import numpy as np
+import pytest
+
+import airo_blender_toolkit as abt
+
+
+def _camera():
+    camera_data = bpy.data.cameras.new("TestCamera")
+    camera = bpy.data.objects.new("TestCamera", camera_data)
+    bpy.context.scene.collection.objects.link(camera)
+    camera.location = (0.0, 0.0, 5.0)
+    return camera
+
+
+def _remove(obj):
+    data = obj.data
+    bpy.data.objects.remove(obj)
+    if isinstance(data, bpy.types.Mesh):
+        bpy.data.meshes.remove(data)
+    elif isinstance(data, bpy.types.Camera):
+        bpy.data.cameras.remove(data)
+
+
+def test_track_keypoints_follows_animation_and_restores_frame():
+    scene = bpy.context.scene
+    original_frame = scene.frame_current
+    camera = _camera()
+    towel = abt.Towel(length=1.0, width=0.5)
+    towel.blender_object.location = (0.0, 0.0, 0.0)
+    towel.blender_object.keyframe_insert(data_path="location", frame=1)
+    towel.blender_object.location = (1.0, 0.0, 0.0)
+    towel.blender_object.keyframe_insert(data_path="location", frame=3)
+
+    scene.frame_set(2)
+    track = towel.track_keypoints(1, 4, cameras=[camera])
+    frame_after_tracking = scene.frame_current
+
+    for frame, positions in zip(track["frames"].tolist(), track["positions"]):
+        scene.frame_set(frame)
+        assert np.allclose(positions, towel.keypoint_snapshot.coordinates)
+        pixels, depths = abt.project_points(positions, camera, scene)
+        assert np.allclose(track["pixels"][frame - 1, 0], pixels)
+        assert np.allclose(track["depths"][frame - 1, 0], depths)
+
+    scene.frame_set(original_frame)
+    _remove(towel.blender_object)
+    _remove(camera)
+
+    assert frame_after_tracking == 2
+    assert track["positions"].shape == (3, 4, 3)
+    assert np.allclose(track["positions"][2] - track["positions"][0], (1.0, 0.0, 0.0))
+    assert track["visible"].shape == (3, 1, 4)
+
+
+def test_track_keypoints_restores_frame_on_error():
+    scene = bpy.context.scene
+    original_frame = scene.frame_current
+    towel = abt.Towel(length=1.0, width=0.5)
+    not_a_camera = bpy.data.objects.new("TestEmpty", None)
+
+    scene.frame_set(7)
+    with pytest.raises(AttributeError):
+        towel.track_keypoints(1, 4, cameras=[not_a_camera])
+    frame_after_error = scene.frame_current
+
+    scene.frame_set(original_frame)
+    bpy.data.objects.remove(not_a_camera)
+    _remove(towel.blender_object)
+
+    assert frame_after_error == 7
+
+
+def test_keypoints_3D_are_in_object_space():
+    towel = abt.Towel(length=1.0, width=0.5)
+    towel.blender_object.location = (1.0, 2.0, 3.0)
+    towel.blender_object.rotation_euler = (0.3, 0.0, 1.2)
+    bpy.context.view_layer.update()
+
+    local = np.array([tuple(vertex.co) for vertex in towel.blender_object.data.vertices])[:4]
+    matrix_world = np.array(towel.blender_object.matrix_world)
+    keypoints = towel.keypoints_3D
+    keypoints_json = towel.json_ready_keypoints(dimension=3, only_visible=False)
+    world = towel.keypoint_snapshot.coordinates
+    _remove(towel.blender_object)
+
+    assert np.allclose(np.array(list(keypoints.values())), local)
+    assert np.allclose(keypoints_json["corner1_keypoints_3D"], local[0])
+    assert np.allclose(world, local @ matrix_world[:3, :3].T + matrix_world[:3, 3])
+
+
+def test_keypoint_snapshot_is_rebuilt_after_changes():
+    towel = abt.Towel(length=1.0, width=0.5)
+    snapshot = towel.keypoint_snapshot
+    unchanged = towel.keypoint_snapshot
+
+    towel.blender_object.location = (1.0, 0.0, 0.0)
+    moved = towel.keypoint_snapshot
+
+    towel.blender_object.data.vertices[0].co.z += 1.0
+    edited = towel.keypoint_snapshot
+
+    towel.invalidate_keypoints()
+    invalidated = towel.keypoint_snapshot
+    _remove(towel.blender_object)
+
+    assert unchanged is snapshot
+    assert moved is not snapshot
+    assert np.allclose(moved.coordinates - snapshot.coordinates, (1.0, 0.0, 0.0))
+    assert edited is not moved
+    assert np.isclose(edited.local_coordinates[0, 2] - moved.local_coordinates[0, 2], 1.0)
+    assert invalidated is not edited
+    assert np.allclose(invalidated.coordinates, edited.coordinates)
@@ -0,0 +1,117 @@
+import bpy
+import numpy as np
+
+import airo_blender_toolkit as abt
+from airo_blender_toolkit.mesh_annotation import _clip_triangles
+
+
+def test_rasterize_triangles():
+    square = np.array([[[2, 1], [6, 1], [6, 4]], [[2, 1], [6, 4], [2, 4]]], dtype=float)
+    mask = abt.rasterize_triangles(square, 8, 6)
+    expected = np.zeros((6, 8), dtype=bool)
+    expected[1:4, 2:6] = True
+    assert np.array_equal(mask, expected)
+    assert abt.mask_bbox(mask) == [2, 1, 4, 3]
+
+
+def test_rasterize_triangles_outside_image():
+    triangle = np.array([[[-10, -10], [-5, -10], [-5, -5]]], dtype=float)
+    assert not np.any(abt.rasterize_triangles(triangle, 8, 6))
+
+
+def test_rasterize_triangles_in_batches():
+    rng = np.random.default_rng(0)
+    triangles = rng.uniform(-5.0, 45.0, size=(50, 3, 2))
+    mask = abt.rasterize_triangles(triangles, 40, 30)
+    for batch_size in [1, 100, 1000]:
+        assert np.array_equal(abt.rasterize_triangles(triangles, 40, 30, batch_size), mask)
+
+
+def test_rasterize_depth():
+    square = np.array([[[2, 1], [6, 1], [6, 4]], [[2, 1], [6, 4], [2, 4]]], dtype=float)
+    depth = abt.rasterize_depth(square, np.full((2, 3), 3.0), 8, 6)
+    assert np.array_equal(np.isfinite(depth), abt.rasterize_triangles(square, 8, 6))
+    assert np.allclose(depth[1:4, 2:6], 3.0)
+
+    # A slanted triangle that is partly in front of the square, its inverse depth is linear in the image
+    triangle = np.array([[[0, 0], [8, 0], [0, 6]]], dtype=float)
+    corner_depths = np.array([[1.0, 5.0, 5.0]])
+    both = abt.rasterize_depth(
+        np.concatenate((square, triangle)), np.concatenate((np.full((2, 3), 3.0), corner_depths)), 8, 6
+    )
+    u, v = 2.5, 1.5
+    weights = np.array([1.0 - u / 8.0 - v / 6.0, u / 8.0, v / 6.0])
+    assert np.isclose(both[1, 2], 1.0 / np.sum(weights / corner_depths[0]))
+    assert np.isclose(both[1, 5], 3.0)  # the far corner of the slanted triangle is behind the square
+
+    ortho = abt.rasterize_depth(triangle, corner_depths, 8, 6, perspective=False)
+    assert np.isclose(ortho[1, 2], np.sum(weights * corner_depths[0]))
+
+
+def test_clip_triangles():
+    corners = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    triangles = np.array([corners, corners, corners, corners])
+    depths = np.array([[2.0, 2.0, 2.0], [2.0, 0.0, 2.0], [2.0, 0.0, 0.0], [0.0, 0.0, -1.0]])
+
+    clipped = _clip_triangles(triangles, depths, near=1.0)
+    assert clipped.shape == (4, 3, 3)  # kept, split in two, shrunk and dropped
+
+    def area(triangle):
+        return 0.5 * np.linalg.norm(np.cross(triangle[1] - triangle[0], triangle[2] - triangle[0]))
+
+    assert np.isclose(area(clipped[0]), 0.5)
+    assert np.isclose(area(clipped[1]), 0.125)  # the corner in front with half of each of its edges
+    assert np.isclose(area(clipped[2]) + area(clipped[3]), 0.5 - 0.125)
+
+
+def test_rle_round_trip():
+    mask = np.random.default_rng(0).uniform(size=(7, 5)) > 0.5
+    mask[0, 0] = True
+    rle = abt.mask_to_rle(mask)
+    assert rle["counts"][0] == 0  # runs start with background
+    assert sum(rle["counts"]) == mask.size
+    assert np.array_equal(abt.rle_to_mask(rle), mask)
+
+
+def _remove(obj):
+    data = obj.data
+    bpy.data.objects.remove(obj)
+    if isinstance(data, bpy.types.Mesh):
+        bpy.data.meshes.remove(data)
+    elif isinstance(data, bpy.types.Camera):
+        bpy.data.cameras.remove(data)
+
+
+def test_mesh_annotation_of_partly_occluded_object():
+    scene = bpy.context.scene
+    render = scene.render
+    saved_settings = render.resolution_x, render.resolution_y, render.resolution_percentage
+    render.resolution_x, render.resolution_y, render.resolution_percentage = 64, 48, 100
+
+    # Far from the origin, away from the objects of the default scene
+    camera_data = bpy.data.cameras.new("TestCamera")
+    camera = bpy.data.objects.new("TestCamera", camera_data)
+    scene.collection.objects.link(camera)
+    camera.location = (500.0, 0.0, 0.0)  # looking along -Z
+    bpy.ops.mesh.primitive_cube_add(size=1.0, location=(500.0, 0.0, -5.0))
+    cube = bpy.context.active_object
+    bpy.ops.mesh.primitive_plane_add(size=0.5, location=(500.0, 0.0, -3.0))
+    plane = bpy.context.active_object
+    bpy.context.view_layer.update()
+
+    full = abt.mesh_annotation(cube, camera)
+    visible = abt.mesh_annotation(cube, camera, only_visible=True)
+    far = abt.DepthMap(np.full((12, 16), 100.0), camera, scene)
+    near = abt.DepthMap(np.full((12, 16), 4.0), camera, scene)
+    with_far_depth_map = abt.mesh_annotation(cube, camera, only_visible=True, depth_map=far)
+    with_near_depth_map = abt.mesh_annotation(cube, camera, only_visible=True, depth_map=near)
+
+    for obj in [cube, plane, camera]:
+        _remove(obj)
+    render.resolution_x, render.resolution_y, render.resolution_percentage = saved_settings
+
+    assert 0.0 < visible["area"] < full["area"]
+    assert not np.any(visible["mask"] & ~full["mask"])
+    assert visible["bbox"] == full["bbox"]  # only the center is hidden
+    assert with_far_depth_map["area"] == full["area"]
+    assert with_near_depth_map["area"] == 0.0
@@ -0,0 +1,130 @@
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+import airo_blender_toolkit as abt
+from airo_blender_toolkit.path import cubic_bezier_polynomial
+
+orientation = Rotation.from_euler("xyz", [10, 20, 30], degrees=True).as_matrix()
+start_pose = abt.Frame.from_orientation_and_position(orientation, [0.0, 0.0, 1.0])
+
+
+def example_paths():
+    return [
+        abt.LinearPath(np.array([0.0, 0.0, 0.0]), np.array([1.0, 2.0, 3.0]), orientation),
+        abt.TiltedEllipticalArcPath(start_pose, [1.0, 0, 0], [0, 1.0, 0], end_angle=180, scale=0.5, tilt_angle=20),
+        abt.TiltedEllipticalArcPath(start_pose, [1.0, 0, 0], [0, 1.0, 0], end_angle=90, orientation_mode="slerp"),
+        abt.TiltedEllipticalArcPath(start_pose, [1.0, 0, 0], [0, 1.0, 0], orientation_mode="constant"),
+        abt.BezierPath([np.zeros(3), np.array([1.0, 0, 0]), np.array([1.0, 1.0, 1.0])], orientation, np.identity(3)),
+    ]
+
+
+def test_poses_match_pose():
+    completions = np.linspace(0, 1, 37)
+    for path in example_paths():
+        poses = path.poses(completions)
+        assert poses.shape == (len(completions), 4, 4)
+        for completion, pose in zip(completions, poses):
+            assert np.allclose(path.pose(completion), pose)
+
+
+def test_adaptive_arc_length_table():
+    linear_path = abt.LinearPath(np.zeros(3), np.ones(3), np.identity(3))
+    path_parameters, arc_lengths = linear_path.adaptive_arc_length_table(tolerance=1e-6)
+    assert len(path_parameters) == 5
+    assert np.isclose(arc_lengths[-1], np.sqrt(3))
+
+    circle = abt.TiltedEllipticalArcPath(abt.Frame.identity(), [1.0, 0, 0], [0, 1.0, 0])
+    path_parameters, arc_lengths = circle.adaptive_arc_length_table(tolerance=1e-3)
+    assert len(path_parameters) < 1001
+    assert abs(arc_lengths[-1] - 2 * np.pi) < 1e-3
+
+    path_parameters, arc_lengths = circle.adaptive_arc_length_table(tolerance=1e-6)
+    assert abs(arc_lengths[-1] - 2 * np.pi) < 1e-6
+
+    circle.init_completion_to_parameter_map(tolerance=1e-6)
+    assert np.isclose(circle.pose(0.5).position, [2.0, 0.0, 0.0]).all()
+
+
+def test_lazy_arc_length_table():
+    path = abt.LinearPath(np.zeros(3), np.ones(3), np.identity(3))
+    assert np.allclose(path.start.position, [0.0, 0.0, 0.0])
+    assert np.allclose(path.end.position, [1.0, 1.0, 1.0])
+    assert path._completion_to_parameter_map is None
+
+    assert path.prepare(tolerance=1e-6) is path
+    assert len(path.completion_to_parameter_map) == 5
+
+
+def test_bezier_matches_cubic_polynomial():
+    control_points = np.random.rand(4, 3)
+    path = abt.BezierPath(control_points, np.identity(3), np.identity(3))
+    t = np.linspace(0, 1, 11)
+    assert np.allclose(path.positions(t), cubic_bezier_polynomial(list(control_points), t[:, np.newaxis]))
+
+
+def _de_casteljau(control_points, t):
+    points = np.repeat(np.asarray(control_points, dtype=float)[np.newaxis], len(t), axis=0)
+    while points.shape[1] > 1:
+        points = (1.0 - t)[:, np.newaxis, np.newaxis] * points[:, :-1] + t[:, np.newaxis, np.newaxis] * points[:, 1:]
+    return points[:, 0]
+
+
+def test_bezier_high_degree():
+    control_points = np.random.default_rng(0).uniform(-1.0, 1.0, size=(51, 3))
+    path = abt.BezierPath(control_points, np.identity(3), np.identity(3))
+    t = np.linspace(0, 1, 101)
+    assert np.allclose(path.positions(t), _de_casteljau(control_points, t), atol=1e-10)
+
+    # The derivative of a Bezier curve is the Bezier curve of its hodograph
+    velocity_control_points = 50 * np.diff(control_points, axis=0)
+    assert np.allclose(path.velocities(t), _de_casteljau(velocity_control_points, t), atol=1e-8)
+
+
+def test_curve_derivatives():
+    t = np.linspace(0.1, 0.9, 9)
+    h = 1e-6
+    paths = [
+        abt.BezierPath(np.random.rand(7, 3), np.identity(3), np.identity(3)),
+        abt.BSplinePath(np.random.rand(7, 3), np.identity(3), np.identity(3)),
+    ]
+    for path in paths:
+        velocities = (path.positions(t + h) - path.positions(t - h)) / (2 * h)
+        accelerations = (path.velocities(t + h) - path.velocities(t - h)) / (2 * h)
+        assert np.allclose(path.velocities(t), velocities, atol=1e-5)
+        assert np.allclose(path.accelerations(t), accelerations, atol=1e-5)
+
+
+def test_bspline_is_clamped():
+    control_points = np.random.rand(6, 3)
+    path = abt.BSplinePath(control_points, np.identity(3), np.identity(3), degree=3)
+    assert np.allclose(path.start.position, control_points[0])
+    assert np.allclose(path.end.position, control_points[-1])
+
+
+def test_composite_path():
+    approach = abt.LinearPath(np.array([0.0, 0.0, 1.0]), np.array([0.0, 0.0, 0.0]), np.identity(3))
+    lift = abt.LinearPath(np.array([0.0, 0.0, 0.0]), np.array([0.0, 0.0, 1.0]), np.identity(3))
+    place = abt.LinearPath(np.array([0.0, 0.0, 1.0]), np.array([2.0, 0.0, 1.0]), np.identity(3))
+    path = abt.CompositePath([approach, lift, place])
+
+    assert np.isclose(path.length, 4.0)
+    assert np.allclose(path.start, approach.start)
+    assert np.allclose(path.end, place.end)
+
+    completions = np.array([0.0, 0.125, 0.25, 0.375, 0.5, 0.75, 1.0])
+    expected_positions = [[0, 0, 1], [0, 0, 0.5], [0, 0, 0], [0, 0, 0.5], [0, 0, 1], [1, 0, 1], [2, 0, 1]]
+    poses = path.poses(completions)
+    assert np.allclose(poses[:, 0:3, 3], expected_positions)
+    for completion, pose in zip(completions, poses):
+        assert np.allclose(path.pose(completion), pose)
+
+
+def test_composite_path_with_many_segments_and_unsorted_queries():
+    points = np.cumsum(np.ones((201, 3)), axis=0)
+    segments = [abt.LinearPath(start, end, np.identity(3)) for start, end in zip(points[:-1], points[1:])]
+    path = abt.CompositePath(segments)
+
+    completions = np.random.default_rng(0).uniform(0.0, 1.0, 500)
+    poses = path.poses(completions)
+    expected_positions = points[0] + completions[:, np.newaxis] * (points[-1] - points[0])
+    assert np.allclose(poses[:, 0:3, 3], expected_positions)
@@ -0,0 +1,57 @@
+import bpy
+import numpy as np
+from bpy_extras.object_utils import world_to_camera_view
+from mathutils import Vector
+
+import airo_blender_toolkit as abt
+
+
+def _camera(scene, camera_type="PERSP", sensor_fit="AUTO", shift=(0.0, 0.0)):
+    camera_data = bpy.data.cameras.new("TestCamera")
+    camera_data.type = camera_type
+    camera_data.sensor_fit = sensor_fit
+    camera_data.shift_x, camera_data.shift_y = shift
+    camera_obj = bpy.data.objects.new("TestCamera", camera_data)
+    scene.collection.objects.link(camera_obj)
+    camera_obj.location = (0.3, -2.0, 1.0)
+    camera_obj.rotation_euler = (1.2, 0.1, 0.2)
+    bpy.context.view_layer.update()
+    return camera_obj
+
+
+def _expected_pixels(scene, camera_obj, points):
+    width, height = abt.image_resolution(scene)
+    expected = []
+    for point in points:
+        u, v, depth = world_to_camera_view(scene, camera_obj, Vector(point))
+        expected.append((u * width, (1.0 - v) * height, depth))
+    return np.array(expected)
+
+
+def test_project_points_matches_world_to_camera_view():
+    scene = bpy.context.scene
+    render = scene.render
+    saved_settings = render.resolution_x, render.resolution_y, render.pixel_aspect_x
+    render.resolution_x, render.resolution_y = 640, 360
+    render.pixel_aspect_x = 1.5
+    points = np.random.default_rng(0).uniform(-1.0, 1.0, size=(20, 3))
+
+    settings = [("PERSP", "AUTO", (0.0, 0.0)), ("PERSP", "VERTICAL", (0.1, -0.2)), ("ORTHO", "HORIZONTAL", (0.2, 0.1))]
+    try:
+        for camera_type, sensor_fit, shift in settings:
+            camera_obj = _camera(scene, camera_type, sensor_fit, shift)
+            pixels, depths = abt.project_points(points, camera_obj, scene)
+            projections = abt.project_to_cameras(points, [camera_obj], scene)[0]
+            expected = _expected_pixels(scene, camera_obj, points)
+
+            camera_data = camera_obj.data
+            bpy.data.objects.remove(camera_obj)
+            bpy.data.cameras.remove(camera_data)
+
+            assert np.allclose(pixels, expected[:, :2], atol=1e-3)
+            assert np.allclose(depths, expected[:, 2], atol=1e-6)
+            width, height = abt.image_resolution(scene)
+            assert np.allclose(projections[:, 0] * width, expected[:, 0], atol=1e-3)
+            assert np.allclose((1.0 - projections[:, 1]) * height, expected[:, 1], atol=1e-3)
+    finally:
+        render.resolution_x, render.resolution_y, render.pixel_aspect_x = saved_settings
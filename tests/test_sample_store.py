@@ -0,0 +1,97 @@
+import json
+
+import numpy as np
+
+import airo_blender_toolkit as abt
+
+
+def test_writer_and_store(tmp_path):
+    rng = np.random.default_rng(0)
+    keypoints = rng.uniform(0.0, 100.0, size=(5, 3, 2)).astype(np.float32)
+    with abt.SampleStoreWriter(tmp_path, amount_of_keypoints=3) as writer:
+        for i in range(5):
+            writer.append(keypoints[i], [2, 0, 1], f"images/{i}_é.png", intrinsics=np.identity(3), image_size=(64, 48))
+
+    store = abt.SampleStore(tmp_path)
+    assert len(store) == 5
+    assert isinstance(store.keypoints, np.memmap)
+    assert np.array_equal(store.keypoints, keypoints)
+    assert store.visibility[4].tolist() == [2, 0, 1]
+    assert np.array_equal(store.intrinsics[2], np.identity(3))
+    assert np.all(np.isnan(store.extrinsics))
+    assert store.image_path(3) == "images/3_é.png"
+    assert store[1]["image_id"] == 1
+    assert store[1]["annotation_id"] == 2
+    assert store[1]["segmentation"] == []
+    assert store.image_sizes[4].tolist() == [64, 48]
+
+
+def test_images_without_samples(tmp_path):
+    with abt.SampleStoreWriter(tmp_path, amount_of_keypoints=1) as writer:
+        assert writer.add_image("empty.png", image_id=9, image_size=(8, 6)) == 9
+        writer.append([[1.0, 2.0]], [2], "a.png")  # a new image, with the next free id
+        writer.append([[3.0, 4.0]], [2], "ignored.png", image_id=10)
+        writer.append([[5.0, 6.0]], [1], "b.png", image_id=2)
+
+    store = abt.SampleStore(tmp_path)
+    assert store.image_ids.tolist() == [9, 10, 2]
+    assert store.image_sizes[0].tolist() == [8, 6]
+    assert store.image_path(1) == "a.png"
+    assert store.samples_of_image(9).tolist() == []
+    assert store.samples_of_image(10).tolist() == [0, 1]
+    assert store.samples_of_image(2).tolist() == [2]
+
+
+def test_coco_round_trip(tmp_path):
+    categories = [dict(supercategory="towel", id=1, name="towel", keypoints=["a", "b"], skeleton=[])]
+    images = [dict(id=image_id, file_name=f"{image_id}.png", width=64, height=48) for image_id in (3, 5, 9)]
+    annotations = [
+        dict(
+            id=10,
+            image_id=5,
+            category_id=1,
+            segmentation=[[0.0, 0.0, 2.0, 0.0, 2.0, 2.0]],
+            area=4.0,
+            bbox=[0.0, 0.0, 2.0, 2.0],
+            iscrowd=0,
+            num_keypoints=2,
+            keypoints=[1.5, 2.0, 2, 3.0, 4.25, 1],
+        ),
+        dict(
+            id=4,
+            image_id=3,
+            category_id=1,
+            segmentation=dict(counts=[3, 2, 59], size=[8, 8]),
+            area=1.0,
+            bbox=[1.0, 1.0, 1.0, 1.0],
+            iscrowd=1,
+            num_keypoints=1,
+            keypoints=[5.0, 6.0, 2, 0.0, 0.0, 0],
+        ),
+        dict(
+            id=7,
+            image_id=5,
+            category_id=1,
+            segmentation=[],
+            area=2.0,
+            bbox=[2.0, 2.0, 1.0, 2.0],
+            iscrowd=0,
+            num_keypoints=1,
+            keypoints=[0.0, 0.0, 0, 7.5, 8.0, 2],
+        ),
+    ]
+    coco = dict(categories=categories, images=images, annotations=annotations)
+    with open(tmp_path / "coco.json", "w") as file:
+        json.dump(coco, file)
+
+    store = abt.sample_store_from_coco(tmp_path / "coco.json", tmp_path / "store")
+    assert store.samples_of_image(5).tolist() == [0, 2]
+    assert store.samples_of_image(3).tolist() == [1]
+    assert store.samples_of_image(9).tolist() == []
+    assert store.image_path(1) == "3.png"
+
+    abt.sample_store_to_coco(tmp_path / "store", tmp_path / "converted.json")
+    with open(tmp_path / "converted.json") as file:
+        converted = json.load(file)
+
+    assert converted == coco
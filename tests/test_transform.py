@@ -1,5 +1,6 @@
 import numpy as np
-from mathutils import Vector
+from mathutils import Matrix, Vector
+from scipy.spatial.transform import Rotation
 
 import airo_blender_toolkit as abt
 
@@ -37,3 +38,36 @@ def test_rotate_point_3D_numpy():
     expected_result = np.array([0, 1, 0])
     point_rotated = abt.rotate_point_3D(point, 90, axis=axis)
     assert np.allclose(point_rotated, expected_result, atol=1e-07)
+
+
+def test_frame_array_inverse_and_compose():
+    rotations = Rotation.random(10, random_state=0)
+    positions = np.random.rand(10, 3)
+    frames = abt.FrameArray.from_rotation(rotations, positions)
+    assert frames.shape == (10, 4, 4)
+    assert np.allclose(frames.positions, positions)
+
+    identities = frames.compose(frames.inverse())
+    assert np.allclose(identities, abt.FrameArray.identity(10))
+    assert np.allclose(frames.inverse()[3], np.linalg.inv(frames[3]))
+    assert isinstance(frames[3], abt.Frame)
+
+
+def test_frame_array_indexing():
+    frames = abt.FrameArray.identity(4)
+    assert isinstance(frames[np.int64(2)], abt.Frame)
+    assert isinstance(frames[1:3], abt.FrameArray)
+    assert type(frames[:, :, 3]) is np.ndarray  # (4, 4) but not a pose
+    assert type(frames[:, 0:3, 3]) is np.ndarray
+
+
+def test_frame_array_conversions():
+    quaternions = Rotation.random(5, random_state=1).as_quat()
+    positions = np.random.rand(5, 3)
+    frames = abt.FrameArray.from_quaternions(quaternions, positions)
+    assert np.allclose(np.abs(np.sum(frames.as_quaternions() * quaternions, axis=1)), 1.0)
+
+    buffer = frames.as_blender_matrices()
+    assert buffer.dtype == np.float32 and buffer.shape == (5 * 16,)
+    assert np.allclose(abt.FrameArray.from_blender_matrices(buffer), frames, atol=1e-6)
+    assert np.allclose(Matrix(buffer[:16].reshape(4, 4).T.tolist()), frames[0], atol=1e-6)
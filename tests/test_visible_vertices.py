@@ -0,0 +1,169 @@
+import bpy
+import numpy as np
+import pytest
+
+import airo_blender_toolkit as abt
+
+
+def test_visibility_context_does_not_rebuild_static_or_moving_objects():
+    # Far from the origin, away from the objects of the default scene
+    camera_data = bpy.data.cameras.new("TestCamera")
+    camera = bpy.data.objects.new("TestCamera", camera_data)
+    bpy.context.scene.collection.objects.link(camera)
+    camera.location = (100.0, -10.0, 0.0)
+    camera.rotation_euler = (np.pi / 2, 0.0, 0.0)  # looking along +Y
+
+    bpy.ops.mesh.primitive_cube_add(size=1.0, location=(100.0, -5.0, 0.0))
+    blocker = bpy.context.active_object
+    blocker.keyframe_insert(data_path="location", frame=1)
+    blocker.location = (110.0, -5.0, 0.0)
+    blocker.keyframe_insert(data_path="location", frame=2)
+
+    bpy.ops.mesh.primitive_cube_add(size=1.0, location=(90.0, 5.0, 0.0))
+    static = bpy.context.active_object
+
+    scene = bpy.context.scene
+    original_frame = scene.frame_current
+    points = np.array([[100.0, 0.0, 0.0]])
+
+    with abt.VisibilityContext() as visibility_context:
+        scene.frame_set(1)
+        occluded_at_first_frame = not abt.are_visible(points, camera, visibility_context=visibility_context)[0]
+        amount_of_builds = visibility_context.amount_of_builds
+
+        scene.frame_set(2)
+        visible_at_second_frame = abt.are_visible(points, camera, visibility_context=visibility_context)[0]
+        scene.frame_set(1)
+        abt.are_visible(points, camera, visibility_context=visibility_context)
+
+        assert visibility_context.amount_of_builds == amount_of_builds
+
+    scene.frame_set(original_frame)
+    for obj in [blocker, static]:
+        mesh = obj.data
+        bpy.data.objects.remove(obj)
+        bpy.data.meshes.remove(mesh)
+    bpy.data.objects.remove(camera)
+    bpy.data.cameras.remove(camera_data)
+
+    assert occluded_at_first_frame
+    assert visible_at_second_frame
+
+
+def _camera(name, location, rotation_euler):
+    camera_data = bpy.data.cameras.new(name)
+    camera = bpy.data.objects.new(name, camera_data)
+    bpy.context.scene.collection.objects.link(camera)
+    camera.location = location
+    camera.rotation_euler = rotation_euler
+    return camera
+
+
+def _remove(obj):
+    data = obj.data
+    bpy.data.objects.remove(obj)
+    if isinstance(data, bpy.types.Mesh):
+        bpy.data.meshes.remove(data)
+    elif isinstance(data, bpy.types.Camera):
+        bpy.data.cameras.remove(data)
+
+
+def test_visible_vertices_from_cameras_on_opposite_sides():
+    bpy.ops.mesh.primitive_cube_add(size=2.0, location=(200.0, 0.0, 0.0))
+    cube = bpy.context.active_object
+    front = _camera("TestFront", (200.0, -10.0, 0.0), (np.pi / 2, 0.0, 0.0))  # looking along +Y
+    back = _camera("TestBack", (200.0, 10.0, 0.0), (np.pi / 2, 0.0, np.pi))  # looking along -Y
+    bpy.context.view_layer.update()
+
+    vertices = np.array([tuple(cube.matrix_world @ vertex.co) for vertex in cube.data.vertices])
+    masks = abt.visible_vertices_masks(cube, [front, back])
+    points_masks = abt.are_visible_from_cameras(vertices, [front, back])
+    front_mask = abt.visible_vertices_mask(cube, front)
+    front_indices = abt.visible_vertices(cube, front)
+
+    for obj in [cube, front, back]:
+        _remove(obj)
+
+    expected = np.array([vertices[:, 1] < 0.0, vertices[:, 1] > 0.0])
+    assert masks.shape == (2, 8)
+    assert np.array_equal(masks, expected)
+    assert np.array_equal(points_masks, expected)
+    assert np.array_equal(front_mask, expected[0])
+    assert front_indices == np.flatnonzero(expected[0]).tolist()
+
+
+def test_depth_map_visible_mask():
+    scene = bpy.context.scene
+    render = scene.render
+    saved_settings = render.resolution_x, render.resolution_y, render.resolution_percentage
+    render.resolution_x, render.resolution_y, render.resolution_percentage = 800, 400, 100
+    camera = _camera("TestDepthCamera", (300.0, 0.0, 0.0), (0.0, 0.0, 0.0))  # looking along -Z
+    bpy.context.view_layer.update()
+
+    # The first row is the top of the image, it is closer than the rest
+    depth = np.full((4, 8), 5.0)
+    depth[0] = 2.0
+    depth_map = abt.DepthMap(depth, camera, scene)
+
+    # The vertical half angle is 0.36 * 400 / 800 for the default 50 mm lens on a 36 mm sensor
+    top, bottom = 3.5 * 0.18 * 0.8, -3.5 * 0.18 * 0.8
+    points = np.array(
+        [
+            [300.0, 0.0, -4.0],  # in front of the surface
+            [300.0, 0.0, -5.005],  # behind it, within the tolerance
+            [300.0, 0.0, -5.5],  # behind it
+            [400.0, 0.0, -4.0],  # outside the image
+            [300.0, 0.0, 4.0],  # behind the camera
+            [300.0, top, -3.5],  # behind the closer top row
+            [300.0, bottom, -3.5],  # in front of the bottom row
+        ]
+    )
+    view_y = abt.project_to_cameras(points[5:], [camera], scene)[0, :, 1]
+    mask = depth_map.visible_mask(points)
+    mask_with_tolerance = depth_map.visible_mask(points, tolerance=1.0)
+
+    scene.frame_set(depth_map.frame + 1)
+    with pytest.warns(UserWarning):
+        depth_map.visible_mask(points)
+    scene.frame_set(depth_map.frame)
+
+    _remove(camera)
+    render.resolution_x, render.resolution_y, render.resolution_percentage = saved_settings
+
+    assert view_y[0] > 0.75 and view_y[1] < 0.25
+    assert mask.tolist() == [True, True, False, False, False, False, True]
+    assert mask_with_tolerance.tolist() == [True, True, True, False, False, False, True]
+
+
+@pytest.mark.skipif("cycles" not in bpy.context.preferences.addons, reason="Cycles is not available")
+def test_render_depth_map_restores_settings(tmp_path):
+    scene = bpy.context.scene
+    render = scene.render
+    saved_resolution = render.resolution_x, render.resolution_y
+    render.resolution_x, render.resolution_y = 64, 32
+
+    camera = _camera("TestDepthCamera", (400.0, 0.0, 0.0), (0.0, 0.0, 0.0))  # looking along -Z
+    bpy.ops.mesh.primitive_cube_add(size=2.0, location=(400.0, 0.0, -5.0))
+    cube = bpy.context.active_object
+
+    scene.use_nodes = True
+    file_output = scene.node_tree.nodes.new("CompositorNodeOutputFile")
+    file_output.base_path = str(tmp_path)
+    scene.use_nodes = False
+    amount_of_nodes = len(scene.node_tree.nodes)
+    settings = (scene.camera, render.engine, render.resolution_percentage, render.use_compositing)
+
+    depth_map = abt.render_depth_map(camera, scene, resolution_percentage=50)
+
+    restored_settings = (scene.camera, render.engine, render.resolution_percentage, render.use_compositing)
+    restored = (scene.use_nodes, file_output.mute, len(scene.node_tree.nodes))
+    scene.node_tree.nodes.remove(file_output)
+    for obj in [cube, camera]:
+        _remove(obj)
+    render.resolution_x, render.resolution_y = saved_resolution
+
+    assert restored_settings == settings
+    assert restored == (False, False, amount_of_nodes)
+    assert list(tmp_path.iterdir()) == []
+    assert depth_map.depth.shape == (16, 32)
+    assert abs(depth_map.depth[8, 16] - 4.0) < 0.05